@@ -0,0 +1,216 @@
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+import numpy as np
+from game_logic import BattleshipGame, FLEET_SIZES, GridSpace, Orientation, Player
+from bot_logic import ComputerPlayer
+
+# board arrays hold GridSpace values, so they compare directly with BattleshipGame boards
+EMPTY = GridSpace.EMPTY.value
+OCCUPIED = GridSpace.OCCUPIED.value
+MISS = GridSpace.MISS.value
+HIT = GridSpace.HIT.value
+DESTROYED = GridSpace.DESTROYED.value
+NO_SHIP = -1
+
+
+class BatchEngine:
+    """Plays many independent games of Battleship in lockstep with NumPy arrays, following the rules of
+    BattleshipGame.attempt_strike and BattleshipGame.winner.
+    spaces has shape (2, games, 10, 10): spaces[0] are player one's boards and spaces[1] player two's, so
+    player_one_boards[g] is the board of the g-th game. turn[g] is 0 while it is player one's turn and 1 while
+    it is player two's, and shots_fired[p, g] counts the strikes player p has made in game g. Every strike, destroy
+    and winner check is done for the whole batch at once."""
+
+    def __init__(self, fleets: list[tuple[list, list]]):
+        """fleets holds, for each game, the locations (row, column, Orientation) of player one's and player two's
+        Ships, in the order of FLEET_SIZES.
+        Raises a ValueError if a Ship leaves the board or two Ships overlap."""
+        games = len(fleets)
+        self.spaces = np.full((2, games, 10, 10), EMPTY, dtype=np.int8)
+        self.player_one_boards = self.spaces[0]
+        self.player_two_boards = self.spaces[1]
+        self.ship_ids = np.full((2, games, 10, 10), NO_SHIP, dtype=np.int8)
+        self.ship_health = np.tile(np.array(FLEET_SIZES, dtype=np.int8), (2, games, 1))
+        self.turn = np.zeros(games, dtype=np.int8)
+        self.shots_fired = np.zeros((2, games), dtype=np.int16)
+        if games == 0:
+            return
+
+        # anchors[player, game, ship] = (row, column, 1 if DOWN else 0)
+        anchors = np.array(
+            [
+                [
+                    [
+                        (row, column, orientation == Orientation.DOWN)
+                        for row, column, orientation in fleet
+                    ]
+                    for fleet in game_fleets
+                ]
+                for game_fleets in fleets
+            ],
+            dtype=np.int16,
+        ).transpose(1, 0, 2, 3)
+        positions = np.arange(max(FLEET_SIZES))
+        down = anchors[..., 2:3]
+        rows = anchors[..., 0:1] + positions * down
+        columns = anchors[..., 1:2] + positions * (1 - down)
+        covered = np.broadcast_to(
+            positions < np.array(FLEET_SIZES)[:, None], rows.shape
+        )
+        players, game_nums, ships, __ = np.nonzero(covered)
+        rows, columns = rows[covered], columns[covered]
+        if rows.min() < 0 or rows.max() > 9 or columns.min() < 0 or columns.max() > 9:
+            raise ValueError("A ship is placed off the board.")
+        self.ship_ids[players, game_nums, rows, columns] = ships
+        self.spaces[players, game_nums, rows, columns] = OCCUPIED
+        if np.count_nonzero(self.ship_ids != NO_SHIP) != len(rows):
+            raise ValueError("Two ships overlap.")
+
+    def __len__(self) -> int:
+        return len(self.turn)
+
+    def strike_arrays(
+        self, rows: np.ndarray, columns: np.ndarray, active: np.ndarray
+    ) -> np.ndarray:
+        """Fires a strike at (rows[g], columns[g]) in every game g where active[g] is True, on behalf of the player
+        whose turn it is, then passes the turn. Returns a bool array that is True where a strike hit.
+        Raises a ValueError without changing any game if a space was already struck."""
+        game_nums = np.nonzero(active)[0]
+        rows, columns = rows[game_nums], columns[game_nums]
+        targets = 1 - self.turn[game_nums]
+        if np.any(self.spaces[targets, game_nums, rows, columns] >= MISS):
+            raise ValueError("Given coordinates have already been struck.")
+
+        ships = self.ship_ids[targets, game_nums, rows, columns]
+        hits = ships != NO_SHIP
+        self.spaces[targets, game_nums, rows, columns] = np.where(hits, HIT, MISS)
+        hit_games, hit_targets, hit_ships = game_nums[hits], targets[hits], ships[hits]
+        self.ship_health[hit_targets, hit_games, hit_ships] -= 1
+
+        sunk = self.ship_health[hit_targets, hit_games, hit_ships] == 0
+        if np.any(sunk):
+            sunk_games, sunk_targets = hit_games[sunk], hit_targets[sunk]
+            sunk_ships = hit_ships[sunk][:, None, None]
+            sunk_cells = self.ship_ids[sunk_targets, sunk_games] == sunk_ships
+            boards = self.spaces[sunk_targets, sunk_games]
+            boards[sunk_cells] = DESTROYED
+            self.spaces[sunk_targets, sunk_games] = boards
+
+        self.shots_fired[self.turn[game_nums], game_nums] += 1
+        self.turn[game_nums] ^= 1
+        result = np.zeros(len(self.turn), dtype=bool)
+        result[game_nums] = hits
+        return result
+
+    def strike(self, moves: list[tuple[int, int] | None]) -> list[bool | None]:
+        """Fires each game's strike as in strike_arrays and returns whether it hit, or None for games given None."""
+        active = np.array([move is not None for move in moves], dtype=bool)
+        coordinates = np.array(
+            [move if move is not None else (0, 0) for move in moves], dtype=np.intp
+        ).reshape(-1, 2)
+        hits = self.strike_arrays(coordinates[:, 0], coordinates[:, 1], active)
+        return [
+            hit if is_active else None
+            for hit, is_active in zip(hits.tolist(), active.tolist())
+        ]
+
+    def winner_values(self) -> np.ndarray:
+        """Returns, for every game, the Player value of its winner, or 0 if it isn't over."""
+        fleets_lost = ~np.any(self.ship_health > 0, axis=2)
+        return np.where(
+            fleets_lost[0],
+            Player.TWO.value,
+            np.where(fleets_lost[1], Player.ONE.value, 0),
+        )
+
+    def winners(self) -> list[Player | None]:
+        """Returns the winner of each game, or None for games that aren't over."""
+        return [
+            Player(value) if value else None for value in self.winner_values().tolist()
+        ]
+
+    def boards(self, game_num: int) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        """Returns the two boards of the game_num-th game as flat tuples of GridSpace values."""
+        return (
+            tuple(self.spaces[0, game_num].ravel().tolist()),
+            tuple(self.spaces[1, game_num].ravel().tolist()),
+        )
+
+    def ordered_strikes(
+        self, orders: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns rows, columns and active arrays for strike_arrays that make each player strike the spaces
+        (row * 10 + column) of orders[player, game] one after another, in every game that isn't over.
+        orders has shape (2, games, 100), and each orders[player, game] must be a
+        permutation of range(100)."""
+        game_nums = np.arange(len(self.turn))
+        shots = np.minimum(self.shots_fired[self.turn, game_nums], 99)
+        cells = orders[self.turn, game_nums, shots]
+        return (cells // 10, cells % 10, self.winner_values() == 0)
+
+    def __repr__(self) -> str:
+        return f"BatchEngine({len(self.turn)} games)"
+
+
+def random_fleets(games: int, seed: int | None = None) -> list[tuple[list, list]]:
+    """Returns fleet locations for the given number of games, placed the way ComputerPlayer places Ships."""
+    if seed is not None:
+        random.seed(seed)
+    game = BattleshipGame()
+    placers = (
+        ComputerPlayer(
+            game.player_one_board,
+            game.player_two_board,
+            game.player_two_ships,
+            game=game,
+        ),
+        ComputerPlayer(
+            game.player_two_board,
+            game.player_one_board,
+            game.player_one_ships,
+            game=game,
+        ),
+    )
+    fleets = []
+    for __ in range(games):
+        game.reset()
+        locations = ([], [])
+        for player_num, (player, ships) in enumerate(
+            ((Player.ONE, game.player_one_ships), (Player.TWO, game.player_two_ships))
+        ):
+            for pos, ship in enumerate(ships):
+                location = placers[player_num].place_ship(ship)
+                game.place_ship(player, pos, location)
+                locations[player_num].append(location)
+        fleets.append(locations)
+    return fleets
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Time games of random strikes played in lockstep by the batch engine"
+    )
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = BatchEngine(random_fleets(args.games, args.seed))
+    # every player strikes the opponent's spaces in a random order
+    orders = np.random.default_rng(args.seed).permuted(
+        np.tile(np.arange(100), (2, args.games, 1)), axis=2
+    )
+    moves = 0
+    start = perf_counter()
+    while True:
+        rows, columns, active = engine.ordered_strikes(orders)
+        if not np.any(active):
+            break
+        engine.strike_arrays(rows, columns, active)
+        moves += int(np.count_nonzero(active))
+    seconds = perf_counter() - start
+    wins = np.bincount(engine.winner_values(), minlength=3)
+    print(
+        f"{args.games} games: player one won {wins[Player.ONE.value]}, player two won {wins[Player.TWO.value]}, "
+        f"{moves} moves in {seconds:.2f}s ({moves / seconds:,.0f} moves per second)"
+    )
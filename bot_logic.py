@@ -1,5 +1,19 @@
-from game_logic import Ship, GridSpace, Orientation
+from collections import OrderedDict
+from functools import lru_cache
+from game_logic import (
+    BattleshipGame,
+    FLEET_SIZES,
+    FULL_BOARD_MASK,
+    GridSpace,
+    Orientation,
+    Player,
+    Ship,
+    zobrist_hash,
+)
+from opening_book import OpeningBook
+from placement_heatmap import PlacementHeatmap
 from random import randrange, random
+from time import perf_counter
 
 
 def weighted_choice(options: list, weights: list[float]) -> int:
@@ -13,6 +27,26 @@ def weighted_choice(options: list, weights: list[float]) -> int:
         x -= weights[pos]
 
 
+@lru_cache(maxsize=None)
+def parity_mask(board_size: int, ship_size: int) -> int:
+    """Returns a board mask, with bit row * board_size + column for the space at (row, column), of the spaces
+    of a board_size board where (row + column) % ship_size == 0.
+    >>> bin(parity_mask(2, 2))
+    '0b1001'
+    >>> bin(parity_mask(3, 3))
+    '0b10100001'"""
+    return sum(
+        1 << (row * board_size + column)
+        for row in range(board_size)
+        for column in range(board_size)
+        if (row + column) % ship_size == 0
+    )
+
+
+# the (row, column) of every board mask bit
+MASK_COORDINATES = tuple((index // 10, index % 10) for index in range(100))
+
+
 def is_type_at_coordinates(
     board: list[list[GridSpace]], coordinates: tuple[int, int], space_type: GridSpace
 ) -> bool:
@@ -30,18 +64,110 @@ def is_type_at_coordinates(
         return False
 
 
+class TranspositionCache:
+    """A bounded LRU cache from observed board states to hunt-mode targeting distributions.
+    A cache should only be shared between ComputerPlayers targeting boards of the same size.
+    >>> cache = TranspositionCache(max_entries=1)
+    >>> cache.get("a") is None
+    True
+    >>> cache.put("a", 1)
+    >>> cache.put("b", 2)
+    >>> cache.get("a") is None, cache.get("b")
+    (True, 2)
+    >>> cache.hit_rate()
+    0.3333333333333333"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the value stored for key, or None if it is not cached."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        """Stores value for key, evicting the least recently used entry if the cache is full."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        """Returns the fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict[str, float]:
+        """Returns the hit, miss and size counters of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "hit_rate": self.hit_rate(),
+        }
+
+    def clear(self) -> None:
+        """Removes every entry and resets the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"TranspositionCache({self.max_entries})"
+
+
 class ComputerPlayer:
+    """Places Ships and chooses strikes against an opponent's board.
+    The ComputerPlayer only reads what the opponent's board shows: sunk Ships are inferred from the spaces that
+    turn DESTROYED, so opponent_ships is only used for the lengths of the opponent's fleet (FLEET_SIZES if it
+    isn't given)."""
+
     def __init__(
         self,
         own_gameboard: list[list[GridSpace]],
         opponent_gameboard: list[list[GridSpace]],
-        opponent_ships: list[Ship],
+        opponent_ships: list[Ship] | None = None,
+        cache: TranspositionCache | None = None,
+        game: BattleshipGame | None = None,
+        opening_book: OpeningBook | str | None = None,
+        heatmap: PlacementHeatmap | None = None,
+        metrics=None,
     ):
         self.own_gameboard = own_gameboard
         self.opponent_gameboard = opponent_gameboard
         self.opponent_ships = opponent_ships
+        self.cache = cache
+        self.game = game
+        self.metrics = metrics
+        self.opening_book = (
+            OpeningBook(opening_book) if isinstance(opening_book, str) else opening_book
+        )
+        self._fleet = (
+            FLEET_SIZES
+            if opponent_ships is None
+            else tuple(ship.size for ship in opponent_ships)
+        )
+        # lengths of the opponent's Ships that haven't been sunk yet, shortest first
+        self._remaining_lengths = sorted(self._fleet)
+        # a board mask of the DESTROYED spaces already put down to a sunk Ship
+        self._sunk_spaces = 0
+        self._shots_fired = 0
         self._last_strike = ()
+        self._last_salvo = []
         self._targets = set()
+        # a board mask of the opponent's spaces self hasn't struck yet
+        self._unstruck = FULL_BOARD_MASK
         self.weights = [
             8.0,
             11.5,
@@ -144,16 +270,45 @@ class ComputerPlayer:
             11.5,
             8.0,
         ]
-        self.smallest_ship_size = 2
+        self._base_weights = tuple(self.weights)
+        if heatmap is not None:
+            self.weights = heatmap.prior(self.weights)
+        self._prior = tuple(self.weights)
+        # targeting distributions depend on the prior, so it is part of the cache key
+        self._prior_key = hash(self._prior)
+        self.smallest_ship_size = self._remaining_lengths[0]
+
+    def reset(self, heatmap: PlacementHeatmap | None = None) -> None:
+        """Gets the ComputerPlayer ready for a new game on the same boards, reusing its weights list.
+        If a heatmap is given, the prior weights are blended from its latest counts."""
+        if heatmap is not None:
+            self._prior = tuple(heatmap.prior(self._base_weights))
+            self._prior_key = hash(self._prior)
+        self.weights[:] = self._prior
+        # a fresh set rather than clear(), which would keep the old table and change the order targets are popped in
+        self._targets = set()
+        self._last_strike = ()
+        self._last_salvo = []
+        self._unstruck = FULL_BOARD_MASK
+        self._remaining_lengths = sorted(self._fleet)
+        self._sunk_spaces = 0
+        self._shots_fired = 0
+        self.smallest_ship_size = self._remaining_lengths[0]
 
     def place_ship(self, ship: Ship) -> tuple[int, int, Orientation]:
-        """Returns the position and orientation of a random valid placement of the given Ship."""
+        """Returns the position and orientation of a random valid placement of the given Ship.
+        If self was given its game, legality comes from the game's placement masks."""
         while True:
             row = randrange(10)
             column = randrange(10)
             orientation = Orientation.ACROSS if randrange(2) == 0 else Orientation.DOWN
 
-            if orientation == Orientation.ACROSS:
+            if self.game is not None:
+                if self.game.can_place_ship(
+                    self._own_player(), ship.size, (row, column, orientation)
+                ):
+                    return (row, column, orientation)
+            elif orientation == Orientation.ACROSS:
                 if column + ship.size <= 10 and all(
                     [
                         self.own_gameboard[row][column + pos] == GridSpace.EMPTY
@@ -171,38 +326,23 @@ class ComputerPlayer:
                     return (row, column, orientation)
 
     def strike_coordinates(self) -> tuple[int, int]:
-        """Returns coordinates of a valid strike. Uses different methods depending on the difficulty given when self was instantiated."""
+        """Returns coordinates of a valid strike. Uses different methods depending on the difficulty given when self was instantiated.
+        If self has metrics, the time taken to choose is recorded in them."""
+        if self.metrics is None:
+            return self._choose_strike()
+        start = perf_counter()
+        coords = self._choose_strike()
+        self.metrics.record_decision(perf_counter() - start)
+        return coords
+
+    def _choose_strike(self) -> tuple[int, int]:
         if len(self._targets) == 0:
-            for ship in reversed(self.opponent_ships):
-                if not ship.is_destroyed:
-                    self.smallest_ship_size = ship.size
-                    break
-            options = []
-            temp_weights = []
-            for row in range(10):
-                for column in range(10):
-                    if (
-                        column + row
-                    ) % self.smallest_ship_size == 0 and self.opponent_gameboard[row][
-                        column
-                    ] in (
-                        GridSpace.EMPTY,
-                        GridSpace.OCCUPIED,
-                    ):
-                        options.append((row, column))
-                        temp_weights.append(self.weights[row * 10 + column])
-            if options == []:
-                for row in range(10):
-                    for column in range(10):
-                        if self.opponent_gameboard[row][column] in (
-                            GridSpace.EMPTY,
-                            GridSpace.OCCUPIED,
-                        ):
-                            options.append((row, column))
-                            temp_weights.append(self.weights[row * 10 + column])
+            options, temp_weights = self._hunt_distribution()
 
             coords = weighted_choice(options, temp_weights)
             self._last_strike = coords
+            self._unstruck &= ~(1 << (coords[0] * 10 + coords[1]))
+            self._shots_fired += 1
             if coords[0] > 9 or coords[0] < 0 or coords[1] > 9 or coords[1] < 0:
                 raise IndexError(
                     "Invalid coordinates generated by ComputerPlayer using difficulty 3"
@@ -211,12 +351,157 @@ class ComputerPlayer:
         else:
             result = self._targets.pop()
             self._last_strike = result
+            self._unstruck &= ~(1 << (result[0] * 10 + result[1]))
+            self._shots_fired += 1
             if result[0] > 9 or result[0] < 0 or result[1] > 9 or result[1] < 0:
                 raise IndexError(
                     f"Invalid coordinates {result} generated by ComputerPlayer using difficulty 3"
                 )
             return result
 
+    def salvo_coordinates(self, count: int) -> list[tuple[int, int]]:
+        """Returns count distinct coordinates to fire together as a salvo, or fewer if there aren't enough spaces left.
+        Known targets are used first. The rest are drawn from the hunt distribution without replacement.
+        Spaces in line with an earlier pick are made less likely, so that a blind salvo rarely spends two
+        shots on one Ship."""
+        if self.metrics is None:
+            return self._choose_salvo(count)
+        start = perf_counter()
+        coordinates = self._choose_salvo(count)
+        self.metrics.record_decision(perf_counter() - start)
+        return coordinates
+
+    def _choose_salvo(self, count: int) -> list[tuple[int, int]]:
+        chosen = [
+            target
+            for target in self._targets
+            if self.opponent_gameboard[target[0]][target[1]]
+            in (GridSpace.EMPTY, GridSpace.OCCUPIED)
+        ][:count]
+        self._targets.difference_update(chosen)
+
+        if len(chosen) < count:
+            options, temp_weights = self._hunt_distribution()
+            candidates = dict(zip(options, temp_weights))
+            for coords in chosen:
+                candidates.pop(coords, None)
+            used_fallback = False
+            while len(chosen) < count:
+                if len(candidates) == 0:
+                    if used_fallback:
+                        break
+                    # the hunt candidates ran out, so fall back to every space not yet struck
+                    used_fallback = True
+                    unchosen = self._unstruck
+                    for row, column in chosen:
+                        unchosen &= ~(1 << (row * 10 + column))
+                    candidates = dict(zip(*self._mask_options(unchosen)))
+                    continue
+                coords = weighted_choice(list(candidates), list(candidates.values()))
+                del candidates[coords]
+                chosen.append(coords)
+                for option in candidates:
+                    if (
+                        option[0] == coords[0]
+                        and abs(option[1] - coords[1]) < self.smallest_ship_size
+                    ) or (
+                        option[1] == coords[1]
+                        and abs(option[0] - coords[0]) < self.smallest_ship_size
+                    ):
+                        candidates[option] /= 2
+
+        self._last_salvo = chosen
+        self._last_strike = chosen[-1] if chosen else ()
+        for row, column in chosen:
+            self._unstruck &= ~(1 << (row * 10 + column))
+        self._shots_fired += len(chosen)
+        return chosen
+
+    def update_salvo_weights(self):
+        """Must be called after the coordinates from salvo_coordinates have been handled by the game.
+        Updates the ComputerPlayer with the results of every strike in the salvo."""
+        targets = set(self._targets)
+        # sinks are worked out for the whole salvo at once, since one salvo can sink Ships that touch
+        self._record_sunk_ships(self._last_salvo)
+        for coords in self._last_salvo:
+            self._last_strike = coords
+            self._targets = set()
+            self.update_weights()
+            targets |= self._targets
+        # a space is only worth targeting while it is next to a Ship that has been hit but not sunk
+        board = self.opponent_gameboard
+        self._targets = {
+            (row, column)
+            for row, column in targets
+            if board[row][column] in (GridSpace.EMPTY, GridSpace.OCCUPIED)
+            and (
+                (row >= 1 and board[row - 1][column] == GridSpace.HIT)
+                or (row <= 8 and board[row + 1][column] == GridSpace.HIT)
+                or (column >= 1 and board[row][column - 1] == GridSpace.HIT)
+                or (column <= 8 and board[row][column + 1] == GridSpace.HIT)
+            )
+        }
+
+    def _own_player(self) -> Player:
+        """Returns which player of self.game the ComputerPlayer is."""
+        if self.own_gameboard is self.game.player_one_board:
+            return Player.ONE
+        return Player.TWO
+
+    def _opponent_board_hash(self) -> int:
+        """Returns the Zobrist hash of the opponent's board, incrementally maintained by the game if one was given."""
+        if self.game is None:
+            return zobrist_hash(self.opponent_gameboard)
+        if self.opponent_gameboard is self.game.player_one_board:
+            return self.game.board_hash(Player.ONE)
+        return self.game.board_hash(Player.TWO)
+
+    def _hunt_distribution(self) -> tuple[list[tuple[int, int]], list[float]]:
+        """Returns the candidate coordinates of a hunt-mode strike and their weights.
+        Tries the opening book, then the transposition cache, if self has them."""
+        if (
+            self.opening_book is not None
+            and self.opening_book.matches(10, self._fleet, self._prior_key)
+            and self._shots_fired < self.opening_book.max_shots
+        ):
+            distribution = self.opening_book.lookup(
+                self._opponent_board_hash(), self.smallest_ship_size
+            )
+            if distribution is not None:
+                return distribution
+        if self.cache is not None:
+            key = (
+                self._opponent_board_hash(),
+                self.smallest_ship_size,
+                self._prior_key,
+            )
+            distribution = self.cache.get(key)
+            if distribution is None:
+                distribution = self._compute_hunt_distribution()
+                self.cache.put(key, distribution)
+            return distribution
+        return self._compute_hunt_distribution()
+
+    def _compute_hunt_distribution(self) -> tuple[list[tuple[int, int]], list[float]]:
+        """Computes the candidate coordinates of a hunt-mode strike and their weights: the unstruck spaces on the
+        smallest remaining Ship's parity, or every unstruck space once those run out."""
+        candidates = parity_mask(10, self.smallest_ship_size) & self._unstruck
+        if candidates == 0:
+            candidates = self._unstruck
+        return self._mask_options(candidates)
+
+    def _mask_options(self, mask: int) -> tuple[list[tuple[int, int]], list[float]]:
+        """Returns the coordinates of the spaces in mask in row-major order, and their weights."""
+        options = []
+        temp_weights = []
+        while mask:
+            lowest = mask & -mask
+            index = lowest.bit_length() - 1
+            options.append(MASK_COORDINATES[index])
+            temp_weights.append(self.weights[index])
+            mask ^= lowest
+        return (options, temp_weights)
+
     def update_weights(self):
         """Must be called after the strike coordinates have been handled by the game.
         Updates the ComputerPlayer's methods based on the results of the last strike."""
@@ -360,6 +645,90 @@ class ComputerPlayer:
             == GridSpace.DESTROYED
         ):
             self._targets = set()
+            self._record_sunk_ships([self._last_strike])
+
+    def _record_sunk_ships(self, strikes: list[tuple[int, int]]) -> None:
+        """Works out which Ships the given strikes sank from the DESTROYED spaces around them that aren't part of an
+        earlier sunk Ship, and takes their lengths off the remaining lengths. Does nothing unless a strike sank
+        something, so it only costs more than a lookup on the turns a Ship goes down."""
+        board = self.opponent_gameboard
+        sinking = [
+            (row, column)
+            for row, column in strikes
+            if board[row][column] == GridSpace.DESTROYED
+            and not self._sunk_spaces >> (row * 10 + column) & 1
+        ]
+        if not sinking:
+            return
+        # Ships that touch a sinking strike through newly DESTROYED spaces sank this turn
+        sunk = set()
+        spaces = list(sinking)
+        while spaces:
+            row, column = spaces.pop()
+            if (
+                0 <= row <= 9
+                and 0 <= column <= 9
+                and (row, column) not in sunk
+                and board[row][column] == GridSpace.DESTROYED
+                and not self._sunk_spaces >> (row * 10 + column) & 1
+            ):
+                sunk.add((row, column))
+                spaces.extend(
+                    (
+                        (row - 1, column),
+                        (row + 1, column),
+                        (row, column - 1),
+                        (row, column + 1),
+                    )
+                )
+        for row, column in sunk:
+            self._sunk_spaces |= 1 << (row * 10 + column)
+
+        best = None
+        for lengths in self._split_sunk_ships(
+            sunk, set(sinking), self._remaining_lengths
+        ):
+            remaining = list(self._remaining_lengths)
+            for length in lengths:
+                remaining.remove(length)
+            # when the spaces can be split more than one way, keep the short Ships afloat, so the parity
+            # doesn't skip a Ship that is still there
+            if best is None or remaining < best:
+                best = remaining
+        if best is None:
+            # the board doesn't match any fleet that is left, so take off the closest length
+            best = list(self._remaining_lengths)
+            if best:
+                best.remove(min(best, key=lambda length: abs(length - len(sunk))))
+        self._remaining_lengths = best
+        if self._remaining_lengths:
+            self.smallest_ship_size = self._remaining_lengths[0]
+
+    def _split_sunk_ships(
+        self,
+        sunk: set[tuple[int, int]],
+        sinking: set[tuple[int, int]],
+        remaining: list[int],
+    ):
+        """Yields the lengths of every set of straight Ships, each with a remaining length and each hit by one of
+        the sinking strikes, that exactly covers the sunk spaces. A single strike sinks a single Ship, so only a
+        salvo sinking touching Ships ever has more than one."""
+        if not sunk:
+            yield []
+            return
+        # the first space in row-major order has to be the top or left end of its Ship
+        row, column = min(sunk)
+        for length in set(remaining):
+            for row_step, column_step in ((0, 1), (1, 0)):
+                ship = {
+                    (row + pos * row_step, column + pos * column_step)
+                    for pos in range(length)
+                }
+                if ship <= sunk and ship & sinking:
+                    rest = list(remaining)
+                    rest.remove(length)
+                    for lengths in self._split_sunk_ships(sunk - ship, sinking, rest):
+                        yield [length] + lengths
 
     def __repr__(self) -> str:
         return f"ComputerPlayer()"
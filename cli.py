@@ -0,0 +1,210 @@
+from argparse import ArgumentParser
+from sys import stdout
+from game_logic import (
+    BattleshipGame,
+    EventType,
+    GameEvent,
+    GridSpace,
+    Orientation,
+    Player,
+)
+from bot_logic import ComputerPlayer
+
+# screen layout, in 1-based terminal lines and columns
+TITLE_LINE = 1
+LABEL_LINE = 3
+HEADER_LINE = 4
+BOARD_TOP = 5
+BOARD_LEFTS = (4, 30)
+STATUS_LINE = 16
+PROMPT_LINE = 19
+
+# the glyphs never change, so GridSpace.__str__ only needs to run once per state
+GLYPHS = {space: str(space) for space in GridSpace}
+
+
+def move_cursor(line: int, column: int) -> str:
+    """Returns the ANSI escape sequence that moves the cursor to the given line and column."""
+    return f"\033[{line};{column}H"
+
+
+def parse_digits(text: str) -> list[int]:
+    """Returns every digit in text as an int.
+    >>> parse_digits("3 7, 41")
+    [3, 7, 4, 1]"""
+    return [int(character) for character in text if character.isdigit()]
+
+
+class TerminalRenderer:
+    """Draws a BattleshipGame in an ANSI terminal.
+    The whole screen is only drawn the first time; after that, only the spaces the game's events say changed
+    are rewritten."""
+
+    def __init__(self, game: BattleshipGame, output=stdout):
+        self.game = game
+        self.output = output
+        self._redraw = True
+        self._changed = set()
+        self._status = ()
+        game.subscribe(self.game_event)
+
+    def game_event(self, event: GameEvent) -> None:
+        """Notes which spaces an event from the game changed."""
+        if event.kind == EventType.RESET:
+            self._redraw = True
+        elif event.player is not None:
+            board_num = 0 if event.player == Player.ONE else 1
+            self._changed.update(
+                (board_num, row, column) for row, column in event.cells
+            )
+
+    def invalidate(self) -> None:
+        """Makes the next draw redraw the whole screen."""
+        self._redraw = True
+        self._status = ()
+
+    def draw(self, *status: str) -> None:
+        """Brings the screen up to date with the game and shows each status line, then leaves the cursor on the prompt line."""
+        parts = []
+        if self._redraw:
+            parts.append("\033[2J")
+            parts.append(move_cursor(TITLE_LINE, BOARD_LEFTS[0]) + "SeaStrike")
+            parts.append(move_cursor(LABEL_LINE, BOARD_LEFTS[0]) + "You")
+            parts.append(move_cursor(LABEL_LINE, BOARD_LEFTS[1]) + "Player 2")
+            for left in BOARD_LEFTS:
+                parts.append(
+                    move_cursor(HEADER_LINE, left)
+                    + " ".join(str(column) for column in range(10))
+                )
+                for row in range(10):
+                    parts.append(move_cursor(BOARD_TOP + row, left - 2) + str(row))
+            self._changed = {
+                (board_num, row, column)
+                for board_num in range(2)
+                for row in range(10)
+                for column in range(10)
+            }
+            self._redraw = False
+
+        boards = self.game.get_player_boards()
+        for board_num, row_num, col_num in sorted(self._changed):
+            space = boards[board_num][row_num][col_num]
+            # the opponent's ships stay hidden until they are hit
+            if board_num == 1 and space == GridSpace.OCCUPIED:
+                space = GridSpace.EMPTY
+            parts.append(
+                move_cursor(BOARD_TOP + row_num, BOARD_LEFTS[board_num] + col_num * 2)
+                + GLYPHS[space]
+            )
+        self._changed.clear()
+
+        for line_num in range(max(len(status), len(self._status))):
+            line = status[line_num] if line_num < len(status) else ""
+            if line_num >= len(self._status) or line != self._status[line_num]:
+                parts.append(move_cursor(STATUS_LINE + line_num, 1) + line + "\033[K")
+        self._status = status
+        parts.append(move_cursor(PROMPT_LINE, 1) + "\033[J")
+        self.output.write("".join(parts))
+        self.output.flush()
+
+    def __repr__(self) -> str:
+        return f"TerminalRenderer({self.game!r})"
+
+
+def place_player_ships(
+    game: BattleshipGame, renderer: TerminalRenderer, placer: ComputerPlayer
+) -> None:
+    """Asks the player where to put each of their Ships. An empty answer places the Ship randomly."""
+    status = "Place your ships!"
+    for ship_index, ship in enumerate(game.player_one_ships):
+        while not ship.placed:
+            renderer.draw(status)
+            answer = input(
+                f"Place your {ship.size}-space ship as 'row column a|d' (Enter for random): "
+            )
+            if answer.strip() == "":
+                location = placer.place_ship(ship)
+            else:
+                digits = parse_digits(answer)
+                orientation = (
+                    Orientation.DOWN
+                    if answer.strip()[-1].lower() == "d"
+                    else Orientation.ACROSS
+                )
+                if len(digits) != 2:
+                    status = f"Could not read a row and column from {answer!r}."
+                    continue
+                location = (digits[0], digits[1], orientation)
+            if game.place_ship(Player.ONE, ship_index, location):
+                status = "Place your ships!"
+            else:
+                status = "That ship doesn't fit there."
+
+
+def play(salvo: bool = False) -> None:
+    """Plays a game against the ComputerPlayer in the terminal."""
+    game = BattleshipGame(salvo)
+    renderer = TerminalRenderer(game)
+    bot = ComputerPlayer(
+        game.player_two_board, game.player_one_board, game.player_one_ships, game=game
+    )
+    placer = ComputerPlayer(
+        game.player_one_board, game.player_two_board, game.player_two_ships
+    )
+    for pos, ship in enumerate(game.player_two_ships):
+        game.place_ship(Player.TWO, pos, bot.place_ship(ship))
+    place_player_ships(game, renderer, placer)
+
+    status = "It is your turn!"
+    last_strike = ""
+    while game.winner() is None:
+        if game.turn == Player.ONE:
+            shots = game.shots_allowed(Player.ONE)
+            renderer.draw(status, last_strike)
+            digits = parse_digits(
+                input(f"Your shot{'s' if shots > 1 else ''} as 'row column': ")
+            )
+            coordinates = list(zip(digits[::2], digits[1::2]))
+            if len(digits) % 2 == 1 or len(coordinates) not in range(1, shots + 1):
+                status = f"Enter {shots} pair{'s' if shots > 1 else ''} of digits."
+                continue
+            try:
+                results = game.attempt_strikes(coordinates)
+            except ValueError as error:
+                status = str(error)
+                continue
+            last_strike = ", ".join(
+                f"You shot at {coords} and it was a {'hit' if result else 'miss'}"
+                for coords, result in zip(coordinates, results)
+            )
+        elif salvo:
+            coordinates = bot.salvo_coordinates(game.shots_allowed(Player.TWO))
+            results = game.attempt_strikes(coordinates)
+            bot.update_salvo_weights()
+            status = ", ".join(
+                f"Player 2 shot at {coords} and it was a {'hit' if result else 'miss'}"
+                for coords, result in zip(coordinates, results)
+            )
+        else:
+            coords = bot.strike_coordinates()
+            result = game.attempt_strike(coords)
+            bot.update_weights()
+            status = (
+                f"Player 2 shot at {coords} and it was a {'hit' if result else 'miss'}"
+            )
+
+    renderer.draw(
+        "You won!" if game.winner() == Player.ONE else "You lost!", last_strike
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Play SeaStrike in the terminal")
+    parser.add_argument(
+        "--salvo", action="store_true", help="fire one shot per surviving ship"
+    )
+    args = parser.parse_args()
+    try:
+        play(args.salvo)
+    except (EOFError, KeyboardInterrupt):
+        stdout.write(move_cursor(PROMPT_LINE, 1) + "\033[J")
@@ -0,0 +1,438 @@
+import os
+import random
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from game_logic import BattleshipGame, GridSpace, Orientation, Player, zobrist_hash
+from bot_logic import ComputerPlayer, TranspositionCache
+from opening_book import OpeningBook
+from simulation import GamePool, build_opening_book, new_bot_game, play_bot_game
+
+# Every hot path has a reference implementation (the plain list-of-lists code) and a fast one. A check plays
+# seeded games through both, raises Divergence at the first move where they disagree and returns the seconds
+# each implementation took.
+
+
+class Divergence(AssertionError):
+    """Raised when a fast implementation stops matching the reference implementation."""
+
+
+class GameBoardEngine:
+    """The reference board engine: one BattleshipGame per game.
+    A board engine plays many games in lockstep. It is built from each game's fleet placements, strike takes one
+    strike per game (or None to skip a game) from the player whose turn it is, boards returns a game's two boards
+    as tuples of GridSpace values in row-major order and winners returns the winner of each
+    game."""
+
+    def __init__(self, fleets: list[tuple[list, list]]):
+        self.games = []
+        for player_one_fleet, player_two_fleet in fleets:
+            game = BattleshipGame()
+            for player, fleet in (
+                (Player.ONE, player_one_fleet),
+                (Player.TWO, player_two_fleet),
+            ):
+                for pos, location in enumerate(fleet):
+                    game.place_ship(player, pos, location)
+            self.games.append(game)
+
+    def strike(self, moves: list[tuple[int, int] | None]) -> list[bool | None]:
+        """Fires each game's strike and returns whether it hit, or None for skipped games."""
+        return [
+            None if coordinates is None else game.attempt_strike(coordinates)
+            for game, coordinates in zip(self.games, moves)
+        ]
+
+    def boards(self, game_num: int) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        """Returns the two boards of the game_num-th game as flat tuples of GridSpace values."""
+        return tuple(
+            tuple(space.value for row in board for space in row)
+            for board in self.games[game_num].get_player_boards()
+        )
+
+    def winners(self) -> list[Player | None]:
+        """Returns the winner of each game, or None for games that aren't over."""
+        return [game.winner() for game in self.games]
+
+    def __repr__(self) -> str:
+        return f"GameBoardEngine({len(self.games)} games)"
+
+
+# fast board engines, by name, checked against GameBoardEngine by check_board_engines
+BOARD_ENGINES = {}
+
+
+def register_board_engine(name: str, engine_class) -> None:
+    """Adds a board engine to the ones compared against GameBoardEngine."""
+    BOARD_ENGINES[name] = engine_class
+
+
+try:
+    from batch_engine import BatchEngine
+except ImportError:  # the batch engine needs NumPy, which is optional
+    pass
+else:
+    register_board_engine("numpy batch", BatchEngine)
+
+
+def fleet_locations(ships) -> list[tuple[int, int, Orientation]]:
+    """Returns the location each of the given placed Ships was placed at."""
+    locations = []
+    for ship in ships:
+        row, column = ship.spaces_occupied[0]
+        across = ship.spaces_occupied[1][0] == row
+        locations.append(
+            (row, column, Orientation.ACROSS if across else Orientation.DOWN)
+        )
+    return locations
+
+
+def game_moves(game: BattleshipGame) -> list[tuple[int, int, Player]]:
+    """Returns every strike made in game so far, in order, as (row, column, player who fired)."""
+    return [(row, column, turn) for row, column, turn, __ in game._undo_stack]
+
+
+def _compare_games(
+    path: str, seed: int, reference: BattleshipGame, fast: BattleshipGame
+) -> None:
+    reference_moves, fast_moves = game_moves(reference), game_moves(fast)
+    for move_num, (reference_move, fast_move) in enumerate(
+        zip(reference_moves, fast_moves)
+    ):
+        if reference_move != fast_move:
+            raise Divergence(
+                f"{path}: seed {seed} move {move_num}: reference played {reference_move}, fast played {fast_move}"
+            )
+    if len(reference_moves) != len(fast_moves):
+        raise Divergence(
+            f"{path}: seed {seed}: reference game lasted {len(reference_moves)} moves, fast game {len(fast_moves)}"
+        )
+    if reference.snapshot() != fast.snapshot() or reference.winner() != fast.winner():
+        raise Divergence(f"{path}: seed {seed}: final states differ")
+
+
+def check_targeting(
+    seeds: range, salvo: bool = False, opening_book: OpeningBook | None = None
+) -> tuple[float, float]:
+    """Compares ComputerPlayers that compute every hunt distribution with ones that use a TranspositionCache
+    (and opening_book, if given)."""
+    start = perf_counter()
+    reference_games = [play_bot_game(seed, salvo=salvo)[0] for seed in seeds]
+    reference_seconds = perf_counter() - start
+
+    cache = TranspositionCache()
+    start = perf_counter()
+    fast_games = [play_bot_game(seed, cache, opening_book, salvo)[0] for seed in seeds]
+    fast_seconds = perf_counter() - start
+
+    for seed, reference, fast in zip(seeds, reference_games, fast_games):
+        _compare_games("targeting", seed, reference, fast)
+    return (reference_seconds, fast_seconds)
+
+
+def _scan_hunt_distribution(
+    board: list[list[GridSpace]], weights: list[float], ship_size: int | None
+) -> tuple[list[tuple[int, int]], list[float]]:
+    """The double loop ComputerPlayer used for hunt candidates before parity masks: the unstruck spaces of board
+    where (row + column) % ship_size == 0, or every unstruck space if there are none.
+    A ship_size of None gives every unstruck space."""
+    options = []
+    temp_weights = []
+    if ship_size is not None:
+        for row in range(10):
+            for column in range(10):
+                if (column + row) % ship_size == 0 and board[row][column] in (
+                    GridSpace.EMPTY,
+                    GridSpace.OCCUPIED,
+                ):
+                    options.append((row, column))
+                    temp_weights.append(weights[row * 10 + column])
+    if options == []:
+        for row in range(10):
+            for column in range(10):
+                if board[row][column] in (GridSpace.EMPTY, GridSpace.OCCUPIED):
+                    options.append((row, column))
+                    temp_weights.append(weights[row * 10 + column])
+    return (options, temp_weights)
+
+
+def _check_bot_distributions(
+    seed: int, move_num: int, bot: ComputerPlayer
+) -> tuple[float, float]:
+    start = perf_counter()
+    reference = _scan_hunt_distribution(
+        bot.opponent_gameboard, bot.weights, bot.smallest_ship_size
+    )
+    reference_unstruck = _scan_hunt_distribution(
+        bot.opponent_gameboard, bot.weights, None
+    )
+    middle = perf_counter()
+    fast = bot._compute_hunt_distribution()
+    fast_unstruck = bot._mask_options(bot._unstruck)
+    fast_seconds = perf_counter() - middle
+    if reference != fast:
+        raise Divergence(
+            f"hunt distribution: seed {seed} move {move_num}: the parity candidates differ"
+        )
+    if reference_unstruck != fast_unstruck:
+        raise Divergence(
+            f"hunt distribution: seed {seed} move {move_num}: the unstruck spaces differ"
+        )
+    return (middle - start, fast_seconds)
+
+
+def check_hunt_distribution(seeds: range, salvo: bool = False) -> tuple[float, float]:
+    """Compares the parity and unstruck board masks ComputerPlayer draws hunt candidates from with scanning the
+    opponent's board, before every decision of seeded games."""
+    reference_seconds = fast_seconds = 0.0
+    for seed in seeds:
+        random.seed(seed)
+        game, bot_one, bot_two = new_bot_game(salvo=salvo)
+        move_num = 0
+        while game.winner() is None:
+            bot = bot_one if game.turn == Player.ONE else bot_two
+            reference, fast = _check_bot_distributions(seed, move_num, bot)
+            reference_seconds += reference
+            fast_seconds += fast
+            if salvo:
+                game.attempt_strikes(
+                    bot.salvo_coordinates(game.shots_allowed(game.turn))
+                )
+                bot.update_salvo_weights()
+            else:
+                game.attempt_strike(bot.strike_coordinates())
+                bot.update_weights()
+            move_num += 1
+    return (reference_seconds, fast_seconds)
+
+
+def check_opening_book(seeds: range, salvo: bool = False) -> tuple[float, float]:
+    """Builds an opening book from the seeded games, then compares ComputerPlayers that compute every hunt
+    distribution with ones that look the first shots up in the book."""
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "opening_book.bin")
+        build_opening_book(path, len(seeds), min_count=1, seed=seeds.start)
+        book = OpeningBook(path)
+        try:
+            return check_targeting(seeds, salvo, book)
+        except Divergence as error:
+            raise Divergence(f"opening book: {error}")
+        finally:
+            book.close()
+
+
+def check_game_pool(seeds: range, salvo: bool = False) -> tuple[float, float]:
+    """Compares newly built games with games reset in place by a GamePool."""
+    start = perf_counter()
+    reference_games = [play_bot_game(seed, salvo=salvo)[0] for seed in seeds]
+    reference_seconds = perf_counter() - start
+
+    # pooled games are reused, so each is compared as soon as it is finished
+    pool = GamePool(salvo=salvo)
+    fast_seconds = 0.0
+    for seed, reference in zip(seeds, reference_games):
+        start = perf_counter()
+        fast, __ = play_bot_game(seed, pool=pool)
+        fast_seconds += perf_counter() - start
+        _compare_games("game pool", seed, reference, fast)
+        pool.release(fast)
+    return (reference_seconds, fast_seconds)
+
+
+def _replay(game: BattleshipGame, fleets, moves):
+    """Places both fleets in the reset game, then yields after each of moves is struck."""
+    game.reset()
+    for player, fleet in zip((Player.ONE, Player.TWO), fleets):
+        for pos, location in enumerate(fleet):
+            game.place_ship(player, pos, location)
+    for row, column, turn in moves:
+        game.turn = turn
+        game.attempt_strike((row, column))
+        yield turn.other_player()
+
+
+def check_board_hash(seeds: range, salvo: bool = False) -> tuple[float, float]:
+    """Compares hashing the whole board with zobrist_hash after every strike with the hash BattleshipGame keeps
+    up to date incrementally."""
+    recorded = []
+    for seed in seeds:
+        game = play_bot_game(seed, salvo=salvo)[0]
+        fleets = (
+            fleet_locations(game.player_one_ships),
+            fleet_locations(game.player_two_ships),
+        )
+        recorded.append((seed, fleets, game_moves(game)))
+
+    game = BattleshipGame(salvo)
+    reference_seconds = fast_seconds = 0.0
+    for seed, fleets, moves in recorded:
+        for move_num, struck_player in enumerate(_replay(game, fleets, moves)):
+            board = (
+                game.player_one_board
+                if struck_player == Player.ONE
+                else game.player_two_board
+            )
+            start = perf_counter()
+            reference = zobrist_hash(board)
+            middle = perf_counter()
+            fast = game.board_hash(struck_player)
+            fast_seconds += perf_counter() - middle
+            reference_seconds += middle - start
+            if reference != fast:
+                raise Divergence(
+                    f"board hash: seed {seed} move {move_num}: zobrist_hash gives {reference}, board_hash {fast}"
+                )
+    return (reference_seconds, fast_seconds)
+
+
+def _fits_per_cell(
+    board: list[list[GridSpace]], size: int, location: tuple[int, int, Orientation]
+) -> bool:
+    """The per-space placement check ComputerPlayer.place_ship uses when it has no game."""
+    row, column, orientation = location
+    if orientation == Orientation.ACROSS:
+        return column + size <= 10 and all(
+            [board[row][column + pos] == GridSpace.EMPTY for pos in range(size)]
+        )
+    return row + size <= 10 and all(
+        [board[row + pos][column] == GridSpace.EMPTY for pos in range(size)]
+    )
+
+
+def check_placement(seeds: range, salvo: bool = False) -> tuple[float, float]:
+    """Compares checking every space a Ship would cover with the legal anchor masks of BattleshipGame, for every
+    location of every ship size after each ship of a seeded fleet is placed."""
+    locations = [
+        (row, column, orientation)
+        for row in range(10)
+        for column in range(10)
+        for orientation in (Orientation.ACROSS, Orientation.DOWN)
+    ]
+    reference_seconds = fast_seconds = 0.0
+    game = BattleshipGame(salvo)
+    for seed in seeds:
+        random.seed(seed)
+        fleet = fleet_locations(new_bot_game(salvo=salvo)[0].player_one_ships)
+        game.reset()
+        for pos, placed in enumerate(fleet):
+            game.place_ship(Player.ONE, pos, placed)
+            for size in range(2, 6):
+                start = perf_counter()
+                reference = [
+                    _fits_per_cell(game.player_one_board, size, location)
+                    for location in locations
+                ]
+                middle = perf_counter()
+                fast = [
+                    game.can_place_ship(Player.ONE, size, location)
+                    for location in locations
+                ]
+                fast_seconds += perf_counter() - middle
+                reference_seconds += middle - start
+                if reference != fast:
+                    location = next(
+                        location
+                        for location, fits, fast_fits in zip(locations, reference, fast)
+                        if fits != fast_fits
+                    )
+                    raise Divergence(
+                        f"placement: seed {seed} ship {pos}: size {size} at {location} disagrees"
+                    )
+    return (reference_seconds, fast_seconds)
+
+
+def check_board_engines(seeds: range) -> dict[str, tuple[float, float]]:
+    """Replays seeded single-shot games through GameBoardEngine and every registered board engine in lockstep,
+    comparing the boards of every game after every strike.
+    Returns the seconds taken by each engine, by name."""
+    recorded = [play_bot_game(seed)[0] for seed in seeds]
+    fleets = [
+        (
+            fleet_locations(game.player_one_ships),
+            fleet_locations(game.player_two_ships),
+        )
+        for game in recorded
+    ]
+    moves = [game_moves(game) for game in recorded]
+    steps = [
+        [None if step >= len(game) else game[step][:2] for game in moves]
+        for step in range(max(len(game) for game in moves))
+    ]
+
+    timings = {}
+    for name, engine_class in BOARD_ENGINES.items():
+        start = perf_counter()
+        reference_engine = GameBoardEngine(fleets)
+        reference_results = [reference_engine.strike(step) for step in steps]
+        reference_winners = reference_engine.winners()
+        reference_seconds = perf_counter() - start
+
+        start = perf_counter()
+        fast_engine = engine_class(fleets)
+        fast_results = [fast_engine.strike(step) for step in steps]
+        fast_winners = fast_engine.winners()
+        fast_seconds = perf_counter() - start
+
+        for step_num, (reference_step, fast_step) in enumerate(
+            zip(reference_results, fast_results)
+        ):
+            if list(reference_step) != list(fast_step):
+                raise Divergence(f"{name}: move {step_num}: strike results differ")
+        if list(reference_winners) != list(fast_winners):
+            raise Divergence(f"{name}: winners differ")
+
+        # boards are compared move by move by replaying once more, one strike at a time
+        reference_engine = GameBoardEngine(fleets)
+        fast_engine = engine_class(fleets)
+        for step_num, step in enumerate(steps):
+            reference_engine.strike(step)
+            fast_engine.strike(step)
+            for game_num, seed in enumerate(seeds):
+                if reference_engine.boards(game_num) != fast_engine.boards(game_num):
+                    raise Divergence(
+                        f"{name}: seed {seed} move {step_num}: boards differ"
+                    )
+        timings[name] = (reference_seconds, fast_seconds)
+    return timings
+
+
+def run_checks(
+    seeds: range, salvo: bool = False, opening_book: OpeningBook | None = None
+) -> dict[str, tuple[float, float]]:
+    """Runs every check and returns the seconds the reference and fast implementation of each hot path took.
+    Raises Divergence at the first difference."""
+    timings = {
+        "hunt distribution": check_hunt_distribution(seeds, salvo),
+        "targeting": check_targeting(seeds, salvo, opening_book),
+        "opening book": check_opening_book(seeds, salvo),
+        "game pool": check_game_pool(seeds, salvo),
+        "board hash": check_board_hash(seeds, salvo),
+        "placement": check_placement(seeds, salvo),
+    }
+    if not salvo:
+        timings.update(check_board_engines(seeds))
+    return timings
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Check fast implementations against the reference and time them"
+    )
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--salvo", action="store_true")
+    parser.add_argument("--opening-book")
+    args = parser.parse_args()
+
+    book = OpeningBook(args.opening_book) if args.opening_book else None
+    try:
+        timings = run_checks(range(args.seed, args.seed + args.games), args.salvo, book)
+    except Divergence as error:
+        raise SystemExit(f"DIVERGENCE {error}")
+    print(f"{'hot path':<18}{'reference':>12}{'fast':>12}{'speedup':>10}")
+    for name, (reference_seconds, fast_seconds) in timings.items():
+        speedup = reference_seconds / fast_seconds if fast_seconds else float("inf")
+        print(
+            f"{name:<18}{reference_seconds:>11.3f}s{fast_seconds:>11.3f}s{speedup:>9.1f}x"
+        )
+    print(f"{args.games} games identical on every hot path")
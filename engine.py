@@ -0,0 +1,175 @@
+import random
+from argparse import ArgumentParser
+from sys import stdin, stdout
+from game_logic import BattleshipGame, GridSpace, Player
+from bot_logic import ComputerPlayer, TranspositionCache
+
+# Line protocol, one command per line, every command gets exactly one reply line:
+#   seastrike                 -> id SeaStrike
+#   newgame [seed N] [salvo]  -> ok
+#   fleet                     -> fleet <size row column A|D> for each of the engine's ships
+#   shoot [count]             -> shot <row column> for each strike the engine wants to make; in a salvo game
+#                                count is at most the number of the engine's ships still afloat
+#   result R C miss|hit       -> ok, reports the outcome of the engine's strike at (R, C)
+#   result R C sunk R C ...   -> ok, the listed spaces are the whole sunk ship, (R, C) included
+#   fire R C                  -> miss | hit | sunk R C ... | gameover R C ...
+#   quit                      -> (no reply, the engine exits)
+# Anything that can't be handled gets "error <message>" and leaves the game unchanged.
+
+
+class Engine:
+    """Wraps a BattleshipGame and a ComputerPlayer so another process can play the ComputerPlayer over text lines.
+    The engine's own fleet is player two of its game. The opponent's fleet is unknown, so player one's board only
+    records the results reported for the engine's strikes, which is all the ComputerPlayer needs to tell which of
+    the opponent's Ships are left."""
+
+    def __init__(self, cache: bool = False):
+        self.cache = TranspositionCache() if cache else None
+        self.game = BattleshipGame()
+        self.bot = None
+        self._pending = []
+        self.new_game()
+
+    def new_game(self, salvo: bool = False) -> None:
+        """Starts a new game with a freshly placed engine fleet."""
+        if self.bot is None or self.game.salvo != salvo:
+            self.game = BattleshipGame(salvo)
+            self.bot = ComputerPlayer(
+                self.game.player_two_board, self.game.player_one_board, cache=self.cache
+            )
+        else:
+            self.game.reset()
+            self.bot.reset()
+        for pos, ship in enumerate(self.game.player_two_ships):
+            self.game.place_ship(Player.TWO, pos, self.bot.place_ship(ship))
+        self._pending = []
+
+    def handle(self, line: str) -> str | None:
+        """Returns the reply to one protocol line, or None if the engine should exit."""
+        words = line.split()
+        if len(words) == 0:
+            return "error empty command"
+        command, arguments = words[0].lower(), words[1:]
+        try:
+            if command == "quit":
+                return None
+            elif command == "seastrike":
+                return "id SeaStrike"
+            elif command == "newgame":
+                return self._new_game_command(arguments)
+            elif command == "fleet":
+                return self._fleet_command()
+            elif command == "shoot":
+                return self._shoot_command(arguments)
+            elif command == "result":
+                return self._result_command(arguments)
+            elif command == "fire":
+                return self._fire_command(arguments)
+            return f"error unknown command {command}"
+        except (ValueError, IndexError) as error:
+            return f"error {error}"
+
+    def _new_game_command(self, arguments: list[str]) -> str:
+        if "seed" in arguments:
+            random.seed(int(arguments[arguments.index("seed") + 1]))
+        self.new_game("salvo" in arguments)
+        return "ok"
+
+    def _fleet_command(self) -> str:
+        placements = []
+        for ship in self.game.player_two_ships:
+            row, column = ship.spaces_occupied[0]
+            across = ship.spaces_occupied[1][0] == row
+            placements.append(f"{ship.size} {row} {column} {'A' if across else 'D'}")
+        return "fleet " + " ".join(placements)
+
+    def _shoot_command(self, arguments: list[str]) -> str:
+        if self._pending:
+            raise ValueError("results of the last shot were not reported")
+        if self.bot._unstruck == 0:
+            raise ValueError("every space has been struck")
+        if self.game.salvo:
+            count = int(arguments[0]) if arguments else 1
+            allowed = self.game.shots_allowed(Player.TWO)
+            if not 1 <= count <= allowed:
+                raise ValueError(
+                    f"{count} shots asked for but the engine has {allowed} ships afloat"
+                )
+            # a copy, since reported results are crossed off while the bot still needs the whole salvo
+            self._pending = list(self.bot.salvo_coordinates(count))
+        else:
+            self._pending = [self.bot.strike_coordinates()]
+        return "shot " + " ".join(f"{row} {column}" for row, column in self._pending)
+
+    def _result_command(self, arguments: list[str]) -> str:
+        row, column = int(arguments[0]), int(arguments[1])
+        outcome = arguments[2].lower()
+        if (row, column) not in self._pending:
+            raise ValueError(f"({row}, {column}) is not a pending shot")
+        board = self.game.player_one_board
+        if outcome == "miss":
+            board[row][column] = GridSpace.MISS
+        elif outcome == "hit":
+            board[row][column] = GridSpace.HIT
+        elif outcome == "sunk":
+            numbers = [int(argument) for argument in arguments[3:]]
+            if len(numbers) % 2 == 1:
+                raise ValueError("sunk spaces must be row column pairs")
+            spaces = list(zip(numbers[::2], numbers[1::2]))
+            for space_row, space_column in spaces:
+                if not (0 <= space_row <= 9 and 0 <= space_column <= 9):
+                    raise ValueError(f"({space_row}, {space_column}) is off the board")
+            if (row, column) not in spaces:
+                raise ValueError(f"the sunk spaces don't include ({row}, {column})")
+            for space_row, space_column in spaces:
+                board[space_row][space_column] = GridSpace.DESTROYED
+        else:
+            raise ValueError(f"unknown result {outcome}")
+
+        self._pending.remove((row, column))
+        if self.game.salvo:
+            if not self._pending:
+                self.bot.update_salvo_weights()
+        else:
+            self.bot.update_weights()
+        return "ok"
+
+    def _fire_command(self, arguments: list[str]) -> str:
+        row, column = int(arguments[0]), int(arguments[1])
+        if not (0 <= row <= 9 and 0 <= column <= 9):
+            raise ValueError(f"({row}, {column}) is off the board")
+        self.game.turn = Player.ONE
+        if not self.game.attempt_strike((row, column)):
+            return "miss"
+        ship = self.game.ship_at_position(Player.TWO, (row, column))
+        if not ship.is_destroyed:
+            return "hit"
+        spaces = " ".join(
+            f"{space_row} {space_column}"
+            for space_row, space_column in ship.spaces_occupied
+        )
+        if self.game.winner() == Player.ONE:
+            return f"gameover {spaces}"
+        return f"sunk {spaces}"
+
+    def __repr__(self) -> str:
+        return f"Engine(cache={self.cache is not None})"
+
+
+def main() -> None:
+    """Answers protocol lines from stdin on stdout until quit or end of input."""
+    parser = ArgumentParser(description="Play the SeaStrike bot over stdin and stdout")
+    parser.add_argument(
+        "--cache", action="store_true", help="reuse hunt distributions across games"
+    )
+    engine = Engine(parser.parse_args().cache)
+    for line in stdin:
+        reply = engine.handle(line)
+        if reply is None:
+            break
+        stdout.write(reply + "\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from random import Random
 
 
 class Orientation(Enum):
@@ -33,6 +34,10 @@ class GridSpace(Enum):
             return "\033[0;31mX\033[0m"
 
 
+# sizes of the ships each player starts with, largest first
+FLEET_SIZES = (5, 4, 3, 3, 2)
+
+
 class Player(Enum):
     ONE = auto()
     TWO = auto()
@@ -42,6 +47,40 @@ class Player(Enum):
         return Player.ONE if self == Player.TWO else Player.TWO
 
 
+class EventType(Enum):
+    """The kinds of changes a BattleshipGame tells its subscribers about."""
+
+    PLACED = auto()
+    MISS = auto()
+    HIT = auto()
+    SUNK = auto()
+    GAME_OVER = auto()
+    # the boards changed in a way the other events don't describe, e.g. by reset, restore or undo_strike
+    RESET = auto()
+
+
+class GameEvent:
+    """A change to a BattleshipGame.
+    player is whose board changed, or the winner for GAME_OVER. cells are the spaces that changed: the placed or
+    sunk Ship's spaces, or just the struck space for MISS and HIT. ship_size is the size of the placed, hit or
+    sunk Ship."""
+
+    def __init__(
+        self,
+        kind: EventType,
+        player: Player | None = None,
+        cells: tuple[tuple[int, int], ...] = (),
+        ship_size: int | None = None,
+    ):
+        self.kind = kind
+        self.player = player
+        self.cells = cells
+        self.ship_size = ship_size
+
+    def __repr__(self) -> str:
+        return f"GameEvent({self.kind}, {self.player}, {self.cells}, {self.ship_size})"
+
+
 class Ship:
     """A classic Battleship ship with a given size."""
 
@@ -52,6 +91,13 @@ class Ship:
         self.spaces_occupied = []
         self.hits = 0
 
+    def reset(self) -> None:
+        """Returns the Ship to its unplaced, undamaged state."""
+        self.is_destroyed = False
+        self.placed = False
+        self.spaces_occupied = []
+        self.hits = 0
+
     def set_destroyed(self, is_destroyed: bool) -> None:
         """Updates the is_destroyed attribute."""
         self.is_destroyed = is_destroyed
@@ -83,29 +129,136 @@ class Ship:
         return f"Ship({self.size})"
 
 
+def _zobrist_keys(seed: int) -> dict[GridSpace, list[int]]:
+    """Returns a random 64-bit key for every (observed state, cell) pair."""
+    rng = Random(seed)
+    return {
+        space: [rng.getrandbits(64) for _ in range(100)]
+        for space in (GridSpace.MISS, GridSpace.HIT, GridSpace.DESTROYED)
+    }
+
+
+# EMPTY and OCCUPIED look the same to the opponent, so only struck states have keys
+ZOBRIST_KEYS = _zobrist_keys(0x5EA5)
+
+
+def zobrist_hash(board: list[list[GridSpace]]) -> int:
+    """Returns the Zobrist hash of the opponent-visible state of the given board.
+    >>> zobrist_hash([[GridSpace.EMPTY] * 10 for _ in range(10)])
+    0
+    >>> board = [[GridSpace.OCCUPIED] * 10 for _ in range(10)]
+    >>> board[3][4] = GridSpace.MISS
+    >>> zobrist_hash(board) == ZOBRIST_KEYS[GridSpace.MISS][34]
+    True"""
+    value = 0
+    for row_num, row in enumerate(board):
+        for col_num, space in enumerate(row):
+            if space in ZOBRIST_KEYS:
+                value ^= ZOBRIST_KEYS[space][row_num * 10 + col_num]
+    return value
+
+
+# copied into each row of a board when the game is reset
+EMPTY_ROW = (GridSpace.EMPTY,) * 10
+
+# bit row * 10 + column of a board mask stands for the space at (row, column)
+FULL_BOARD_MASK = (1 << 100) - 1
+# for each ship size, the spaces far enough from the right edge to anchor a Ship placed ACROSS
+ACROSS_ANCHOR_LIMITS = {
+    size: sum(
+        1 << (row * 10 + column) for row in range(10) for column in range(11 - size)
+    )
+    for size in range(1, 11)
+}
+
+
 class BattleshipGame:
-    """Implements the game logic for a game of Battleship."""
+    """Implements the game logic for a game of Battleship.
+    If metrics is given, every strike and the end of the game are counted in it (see
+    metrics.GameMetrics)."""
 
-    def __init__(self):
+    def __init__(self, salvo: bool = False, metrics=None):
+        self.salvo = salvo
+        self.metrics = metrics
         self.player_one_board = [
             [GridSpace.EMPTY for __ in range(10)] for _ in range(10)
         ]
         self.player_two_board = [
             [GridSpace.EMPTY for __ in range(10)] for _ in range(10)
         ]
-        self.player_one_ships = [Ship(5), Ship(4), Ship(3), Ship(3), Ship(2)]
-        self.player_two_ships = [Ship(5), Ship(4), Ship(3), Ship(3), Ship(2)]
+        self.player_one_ships = [Ship(size) for size in FLEET_SIZES]
+        self.player_two_ships = [Ship(size) for size in FLEET_SIZES]
         self.turn = Player.ONE
+        self.board_hashes = {Player.ONE: 0, Player.TWO: 0}
+        self._undo_stack = []
+        self._free_spaces = {Player.ONE: FULL_BOARD_MASK, Player.TWO: FULL_BOARD_MASK}
+        self._anchor_masks = {Player.ONE: {}, Player.TWO: {}}
+        self._game_recorded = False
+        self._subscribers = []
+
+    def subscribe(self, callback) -> None:
+        """Makes the game call callback with a GameEvent after every change to it.
+        >>> game = BattleshipGame()
+        >>> events = []
+        >>> game.subscribe(events.append)
+        >>> game.place_ship(Player.TWO, 4, (0, 0, Orientation.ACROSS))
+        True
+        >>> game.attempt_strike((0, 0))
+        True
+        >>> game.turn = Player.ONE
+        >>> game.attempt_strike((0, 1))
+        True
+        >>> [event.kind.name for event in events]
+        ['PLACED', 'HIT', 'SUNK']
+        >>> events[-1].cells
+        ((0, 0), (0, 1))"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        """Stops calling a callback given to subscribe."""
+        self._subscribers.remove(callback)
+
+    def _emit(self, event: GameEvent) -> None:
+        for callback in list(self._subscribers):
+            callback(event)
 
     def get_player_boards(self) -> tuple[list[list[GridSpace]], list[list[GridSpace]]]:
         return (self.player_one_board, self.player_two_board)
 
-    def place_ship(
-        self, player: Player, ship_index: int, location: tuple[int, int, Orientation]
-    ):
-        """Places the ship_index-th Ship on the given player's board at the given row and column with the given orientation."""
+    def legal_anchors(
+        self, player: Player, ship_size: int, orientation: Orientation
+    ) -> int:
+        """Returns a board mask of every space a Ship of ship_size can be placed at with the given orientation
+        on the given player's board. The mask is cached until that board changes."""
+        cache = self._anchor_masks[player]
+        mask = cache.get((ship_size, orientation))
+        if mask is None:
+            free = self._free_spaces[player]
+            mask = free
+            step = 1 if orientation == Orientation.ACROSS else 10
+            for pos in range(1, ship_size):
+                mask &= free >> (pos * step)
+            if orientation == Orientation.ACROSS:
+                mask &= ACROSS_ANCHOR_LIMITS[ship_size]
+            cache[(ship_size, orientation)] = mask
+        return mask
+
+    def can_place_ship(
+        self, player: Player, ship_size: int, location: tuple[int, int, Orientation]
+    ) -> bool:
+        """Returns True if a Ship of ship_size fits on the given player's board at the given row and column with
+        the given orientation, staying on the board and only covering EMPTY spaces."""
         row, column, orientation = location
+        if not (0 <= row <= 9 and 0 <= column <= 9):
+            return False
+        anchors = self.legal_anchors(player, ship_size, orientation)
+        return anchors >> (row * 10 + column) & 1 == 1
 
+    def place_ship(
+        self, player: Player, ship_index: int, location: tuple[int, int, Orientation]
+    ) -> bool:
+        """Places the ship_index-th Ship on the given player's board at the given row and column with the given orientation.
+        Returns False without placing it if it doesn't fit there."""
         board = self.player_one_board if player == Player.ONE else self.player_two_board
         ship = (
             self.player_one_ships[ship_index]
@@ -114,27 +267,29 @@ class BattleshipGame:
         )
 
         # check if you can place ship there before placing it
-        if orientation == Orientation.ACROSS:
-            if not all(
-                [
-                    board[row][column + pos] == GridSpace.EMPTY
-                    for pos in range(ship.size)
-                ]
-            ):
-                return
-        elif orientation == Orientation.DOWN:
-            if not all(
-                [
-                    board[row + pos][column] == GridSpace.EMPTY
-                    for pos in range(ship.size)
-                ]
-            ):
-                return
+        if not self.can_place_ship(player, ship.size, location):
+            return False
 
-        ship.place((row, column, orientation))
-        # print(f'Placed ship at ({row}, {column}) with orientation {orientation}. Spaces occupied: {ship.spaces_occupied}')
+        ship.place(location)
         for coord in ship.spaces_occupied:
             board[coord[0]][coord[1]] = GridSpace.OCCUPIED
+            self._free_spaces[player] &= ~(1 << (coord[0] * 10 + coord[1]))
+        self._anchor_masks[player].clear()
+        if self._subscribers:
+            self._emit(
+                GameEvent(
+                    EventType.PLACED,
+                    player,
+                    tuple(ship.spaces_occupied),
+                    ship.size,
+                )
+            )
+        return True
+
+    def board_hash(self, player: Player) -> int:
+        """Returns the Zobrist hash of the opponent-visible state of the given player's board.
+        It is kept up to date incrementally by attempt_strike."""
+        return self.board_hashes[player]
 
     def ship_at_position(self, player: Player, coordinates: tuple[int, int]) -> Ship:
         """Returns the Ship object that is at the given row and column on the given player's board."""
@@ -147,8 +302,12 @@ class BattleshipGame:
 
     def attempt_strike(self, coordinates: tuple[int, int]) -> bool | None:
         """Attempts a strike at the given row and column. Returns True if it was a hit.
-        Returns None if the coordinates have already been struck at."""
+        Raises a ValueError without changing the game if the coordinates are off the board or have
+        already been struck."""
         row, column = coordinates
+        if not (0 <= row <= 9 and 0 <= column <= 9):
+            raise ValueError(f"Given coordinates {coordinates} are off the board.")
+        targeted_player = self.turn.other_player()
 
         targeted_board = (
             self.player_two_board if self.turn == Player.ONE else self.player_one_board
@@ -162,54 +321,314 @@ class BattleshipGame:
                 f"Given coordinates {coordinates} have already been struck."
             )
         elif targeted_board[row][column] == GridSpace.OCCUPIED:
-            hit_ship: Ship = self.ship_at_position(
-                self.turn.other_player(), (row, column)
+            hit_ship = self.ship_at_position(targeted_player, (row, column))
+        else:
+            hit_ship = None
+        result = self._resolve_strike(
+            targeted_player, targeted_board, row, column, hit_ship
+        )
+        if self._subscribers:
+            self._emit_game_over(targeted_player)
+        self.turn = self.turn.other_player()
+        return result
+
+    def shots_allowed(self, player: Player) -> int:
+        """Returns how many shots the given player fires per turn.
+        That is 1, or in a salvo game the number of the player's Ships still afloat."""
+        if not self.salvo:
+            return 1
+        ships = self.player_one_ships if player == Player.ONE else self.player_two_ships
+        return sum(1 for ship in ships if not ship.is_destroyed)
+
+    def attempt_strikes(self, coordinates: list[tuple[int, int]]) -> list[bool]:
+        """Fires every strike in coordinates as one turn and returns whether each one was a hit.
+        Raises a ValueError without changing the game if there are no strikes or more than shots_allowed,
+        if a strike is repeated, or if any of the coordinates are off the board or have already been
+        struck."""
+        if len(coordinates) == 0:
+            raise ValueError("No strikes given.")
+        if len(coordinates) > self.shots_allowed(self.turn):
+            raise ValueError(
+                f"{len(coordinates)} strikes given but only {self.shots_allowed(self.turn)} are allowed."
             )
+        if len(set(coordinates)) != len(coordinates):
+            raise ValueError(f"Given coordinates {coordinates} contain duplicates.")
+        targeted_player = self.turn.other_player()
+        targeted_board, targeted_ships = (
+            (self.player_two_board, self.player_two_ships)
+            if self.turn == Player.ONE
+            else (self.player_one_board, self.player_one_ships)
+        )
+        for row, column in coordinates:
+            if not (0 <= row <= 9 and 0 <= column <= 9):
+                raise ValueError(
+                    f"Given coordinates {(row, column)} are off the board."
+                )
+            if targeted_board[row][column] in (
+                GridSpace.DESTROYED,
+                GridSpace.HIT,
+                GridSpace.MISS,
+            ):
+                raise ValueError(
+                    f"Given coordinates {(row, column)} have already been struck."
+                )
+
+        ships_by_space = {
+            space: ship for ship in targeted_ships for space in ship.spaces_occupied
+        }
+        results = [
+            self._resolve_strike(
+                targeted_player,
+                targeted_board,
+                row,
+                column,
+                ships_by_space.get((row, column)),
+            )
+            for row, column in coordinates
+        ]
+        if self._subscribers:
+            self._emit_game_over(targeted_player)
+        self.turn = self.turn.other_player()
+        return results
+
+    def _emit_game_over(self, targeted_player: Player) -> None:
+        """Tells the subscribers the game is over if the strikes just made sank the last of targeted_player's Ships."""
+        ships = (
+            self.player_one_ships
+            if targeted_player == Player.ONE
+            else self.player_two_ships
+        )
+        if all(ship.is_destroyed for ship in ships):
+            self._emit(GameEvent(EventType.GAME_OVER, self.turn))
+
+    def _resolve_strike(
+        self,
+        targeted_player: Player,
+        targeted_board: list[list[GridSpace]],
+        row: int,
+        column: int,
+        hit_ship: Ship | None,
+    ) -> bool:
+        """Marks a strike that is known to be valid on targeted_board and returns True if it hit hit_ship.
+        Does not change whose turn it is."""
+        index = row * 10 + column
+        self._undo_stack.append(
+            (row, column, self.turn, self.board_hashes[targeted_player])
+        )
+        if self.metrics is not None:
+            self.metrics.record_strike(None if hit_ship is None else hit_ship.size)
+        if hit_ship is not None:
             hit_ship.hit()
             if hit_ship.is_destroyed:
+                board_hash = self.board_hashes[targeted_player]
                 for coord in hit_ship.spaces_occupied:
+                    coord_index = coord[0] * 10 + coord[1]
+                    if coord_index != index:
+                        board_hash ^= ZOBRIST_KEYS[GridSpace.HIT][coord_index]
+                    board_hash ^= ZOBRIST_KEYS[GridSpace.DESTROYED][coord_index]
                     targeted_board[coord[0]][coord[1]] = GridSpace.DESTROYED
+                self.board_hashes[targeted_player] = board_hash
+                if self._subscribers:
+                    self._emit(
+                        GameEvent(
+                            EventType.SUNK,
+                            targeted_player,
+                            tuple(hit_ship.spaces_occupied),
+                            hit_ship.size,
+                        )
+                    )
             else:
                 targeted_board[row][column] = GridSpace.HIT
-            self.turn = self.turn.other_player()
+                self.board_hashes[targeted_player] ^= ZOBRIST_KEYS[GridSpace.HIT][index]
+                if self._subscribers:
+                    self._emit(
+                        GameEvent(
+                            EventType.HIT,
+                            targeted_player,
+                            ((row, column),),
+                            hit_ship.size,
+                        )
+                    )
             return True
         else:
-            self.turn = self.turn.other_player()
             targeted_board[row][column] = GridSpace.MISS
+            self.board_hashes[targeted_player] ^= ZOBRIST_KEYS[GridSpace.MISS][index]
+            self._free_spaces[targeted_player] &= ~(1 << index)
+            self._anchor_masks[targeted_player].clear()
+            if self._subscribers:
+                self._emit(GameEvent(EventType.MISS, targeted_player, ((row, column),)))
             return False
 
+    def undo_strike(self) -> None:
+        """Takes back the last strike, restoring the boards, Ships and turn.
+        Each strike of a salvo is taken back separately."""
+        if not self._undo_stack:
+            raise ValueError("There are no strikes to undo.")
+        row, column, turn, board_hash = self._undo_stack.pop()
+        targeted_player = turn.other_player()
+        targeted_board = (
+            self.player_two_board if turn == Player.ONE else self.player_one_board
+        )
+
+        if targeted_board[row][column] == GridSpace.MISS:
+            targeted_board[row][column] = GridSpace.EMPTY
+            self._free_spaces[targeted_player] |= 1 << (row * 10 + column)
+            self._anchor_masks[targeted_player].clear()
+        else:
+            hit_ship = self.ship_at_position(targeted_player, (row, column))
+            if hit_ship.is_destroyed:
+                for coord in hit_ship.spaces_occupied:
+                    targeted_board[coord[0]][coord[1]] = GridSpace.HIT
+                hit_ship.set_destroyed(False)
+            targeted_board[row][column] = GridSpace.OCCUPIED
+            hit_ship.hits -= 1
+        self.turn = turn
+        self.board_hashes[targeted_player] = board_hash
+        if self._subscribers:
+            self._emit(GameEvent(EventType.RESET))
+
+    def snapshot(self) -> tuple:
+        """Returns a flat, immutable copy of the game state that can be given to restore."""
+        return (
+            tuple(space for row in self.player_one_board for space in row),
+            tuple(space for row in self.player_two_board for space in row),
+            tuple(
+                (ship.hits, ship.is_destroyed, ship.placed, ship.spaces_occupied)
+                for ship in self.player_one_ships + self.player_two_ships
+            ),
+            self.turn,
+            self.board_hashes[Player.ONE],
+            self.board_hashes[Player.TWO],
+            tuple(self._undo_stack),
+            self._free_spaces[Player.ONE],
+            self._free_spaces[Player.TWO],
+        )
+
+    def restore(self, snapshot: tuple) -> None:
+        """Puts the game back in the state it was in when snapshot was taken.
+        The boards and Ships are updated in place, so references to them stay valid."""
+        (
+            one_spaces,
+            two_spaces,
+            ship_states,
+            turn,
+            one_hash,
+            two_hash,
+            undo,
+            one_free,
+            two_free,
+        ) = snapshot
+        for row_num in range(10):
+            start = row_num * 10
+            self.player_one_board[row_num][:] = one_spaces[start : start + 10]
+            self.player_two_board[row_num][:] = two_spaces[start : start + 10]
+        ships = self.player_one_ships + self.player_two_ships
+        for ship, state in zip(ships, ship_states):
+            ship.hits, ship.is_destroyed, ship.placed, ship.spaces_occupied = state
+        self.turn = turn
+        self.board_hashes[Player.ONE] = one_hash
+        self.board_hashes[Player.TWO] = two_hash
+        self._undo_stack[:] = undo
+        self._free_spaces[Player.ONE] = one_free
+        self._free_spaces[Player.TWO] = two_free
+        self._anchor_masks[Player.ONE].clear()
+        self._anchor_masks[Player.TWO].clear()
+        if self._subscribers:
+            self._emit(GameEvent(EventType.RESET))
+
+    def clone(self) -> "BattleshipGame":
+        """Returns an independent copy of the game."""
+        game = BattleshipGame(self.salvo)
+        game.restore(self.snapshot())
+        return game
+
+    def history(self) -> dict:
+        """Returns a record of the game so far made of plain values, so it can be stored as JSON: whether it is a salvo
+        game, where each player's Ships were placed as [row, column, "A" or "D"] (None for Ships not placed yet),
+        every strike in order as [row, column, player who fired] and the winner, with players given as 1 or 2.
+        >>> game = BattleshipGame()
+        >>> game.place_ship(Player.TWO, 4, (0, 0, Orientation.DOWN))
+        True
+        >>> game.attempt_strike((1, 0))
+        True
+        >>> record = game.history()
+        >>> record["fleets"][1], record["moves"]
+        ([None, None, None, None, [0, 0, 'D']], [[1, 0, 1]])"""
+        fleets = []
+        for ships in (self.player_one_ships, self.player_two_ships):
+            fleet = []
+            for ship in ships:
+                if not ship.placed:
+                    fleet.append(None)
+                    continue
+                row, column = ship.spaces_occupied[0]
+                across = ship.size == 1 or ship.spaces_occupied[1][0] == row
+                fleet.append([row, column, "A" if across else "D"])
+            fleets.append(fleet)
+        winner = self.winner()
+        return {
+            "salvo": self.salvo,
+            "fleets": fleets,
+            "moves": [
+                [row, column, turn.value] for row, column, turn, __ in self._undo_stack
+            ],
+            "winner": None if winner is None else winner.value,
+        }
+
     def winner(self) -> Player | None:
         """Returns the winner (of type Player) if there is one. Otherwise, returns None."""
         if all([ship.is_destroyed for ship in self.player_one_ships]):
-            return Player.TWO
+            result = Player.TWO
         elif all([ship.is_destroyed for ship in self.player_two_ships]):
-            return Player.ONE
+            result = Player.ONE
+        else:
+            return None
+        if self.metrics is not None and not self._game_recorded:
+            self._game_recorded = True
+            self.metrics.record_game(
+                sum(1 for strike in self._undo_stack if strike[2] == result)
+            )
+        return result
 
     def __repr__(self) -> str:
+        if self.salvo:
+            return f"BattleshipGame(salvo=True)"
         return f"BattleshipGame()"
 
     def __str__(self) -> str:
-        output = "      Player 1\n"
-        for row in self.player_one_board:
-            for space in row:
-                output += str(space) + " "
-            output += "\n"
-
-        output += "\n      Player 2\n"
-        for row in self.player_two_board:
-            for space in row:
-                output += str(space) + " "
-            output += "\n"
-        return output
+        lines = ["      Player 1"]
+        lines.extend(
+            "".join(str(space) + " " for space in row) for row in self.player_one_board
+        )
+        lines.append("\n      Player 2")
+        lines.extend(
+            "".join(str(space) + " " for space in row) for row in self.player_two_board
+        )
+        return "\n".join(lines) + "\n"
 
     def reset(self):
-        """Reset the game."""
-        self.player_one_board = [
-            [GridSpace.EMPTY for __ in range(10)] for _ in range(10)
-        ]
-        self.player_two_board = [
-            [GridSpace.EMPTY for __ in range(10)] for _ in range(10)
-        ]
-        self.player_one_ships = [Ship(5), Ship(4), Ship(3), Ship(3), Ship(2)]
-        self.player_two_ships = [Ship(5), Ship(4), Ship(3), Ship(3), Ship(2)]
+        """Reset the game. The boards and Ships are reset in place, so references to them stay valid."""
+        for board in (self.player_one_board, self.player_two_board):
+            for row in board:
+                row[:] = EMPTY_ROW
+        for ship in self.player_one_ships:
+            ship.reset()
+        for ship in self.player_two_ships:
+            ship.reset()
         self.turn = Player.ONE
+        self.board_hashes[Player.ONE] = 0
+        self.board_hashes[Player.TWO] = 0
+        self._undo_stack.clear()
+        self._free_spaces[Player.ONE] = FULL_BOARD_MASK
+        self._free_spaces[Player.TWO] = FULL_BOARD_MASK
+        self._anchor_masks[Player.ONE].clear()
+        self._anchor_masks[Player.TWO].clear()
+        self._game_recorded = False
+        if self._subscribers:
+            self._emit(GameEvent(EventType.RESET))
+
+
+if __name__ == "__main__":
+    from doctest import testmod
+
+    testmod()
@@ -0,0 +1,293 @@
+import json
+import os
+import socket
+from argparse import ArgumentParser
+from time import time
+from game_logic import Player
+from bot_logic import TranspositionCache
+from metrics import GameMetrics, MetricsExporter
+from simulation import GamePool, play_bot_game
+
+# A queue is a directory shared by every worker:
+#   pending/shard-N.json            work units waiting for a worker
+#   claimed/shard-N.json.WORKER     work units being played, claimed by an atomic rename
+#   results/shard-N.WORKER.partial  results of a work unit so far, one line per chunk of games
+#   results/shard-N.jsonl           results of a finished work unit
+#   done/shard-N.json               finished work units
+QUEUE_DIRECTORIES = ("pending", "claimed", "results", "done")
+
+
+def create_jobs(
+    queue_dir: str,
+    games: int,
+    shard_size: int = 10000,
+    seed: int = 0,
+    salvo: bool = False,
+) -> int:
+    """Splits games into work units of at most shard_size seeded games each and queues them in queue_dir.
+    Returns the number of work units created."""
+    for directory in QUEUE_DIRECTORIES:
+        os.makedirs(os.path.join(queue_dir, directory), exist_ok=True)
+    shards = 0
+    for first_game in range(0, games, shard_size):
+        # named after the first seed, so queueing more games with other seeds never clashes
+        name = f"shard-{seed + first_game:012d}.json"
+        job = {
+            "first_seed": seed + first_game,
+            "games": min(shard_size, games - first_game),
+            "salvo": salvo,
+        }
+        temp_path = os.path.join(queue_dir, f".{name}.tmp")
+        with open(temp_path, "w") as file:
+            json.dump(job, file)
+        os.replace(temp_path, os.path.join(queue_dir, "pending", name))
+        shards += 1
+    return shards
+
+
+def claim_job(queue_dir: str, worker_id: str) -> str | None:
+    """Claims a pending work unit for worker_id and returns the path of its claim, or None if none are left.
+    The claim is an atomic rename, so each work unit goes to exactly one worker."""
+    for name in sorted(os.listdir(os.path.join(queue_dir, "pending"))):
+        claim_path = os.path.join(queue_dir, "claimed", f"{name}.{worker_id}")
+        try:
+            os.rename(os.path.join(queue_dir, "pending", name), claim_path)
+        except FileNotFoundError:
+            # another worker claimed it first
+            continue
+        return claim_path
+    return None
+
+
+def new_summary() -> dict:
+    """Returns empty aggregate statistics."""
+    return {"games": 0, "wins": [0, 0], "shots": 0, "shots_histogram": {}}
+
+
+def add_summary(total: dict, summary: dict) -> None:
+    """Adds the statistics in summary to total."""
+    total["games"] += summary["games"]
+    total["wins"][0] += summary["wins"][0]
+    total["wins"][1] += summary["wins"][1]
+    total["shots"] += summary["shots"]
+    for shots, count in summary["shots_histogram"].items():
+        total["shots_histogram"][shots] = total["shots_histogram"].get(shots, 0) + count
+
+
+def run_job(
+    queue_dir: str,
+    claim_path: str,
+    worker_id: str,
+    chunk_size: int = 1000,
+    metrics: GameMetrics | None = None,
+    cache: bool = False,
+) -> bool:
+    """Plays the games of a claimed work unit, appending a line of statistics to its partial results every
+    chunk_size games, then publishes the results and marks the work unit done. The games record into metrics
+    if it is given, and share a TranspositionCache if cache is True. Returns False, and drops the partial
+    results, if the work unit was requeued by requeue_stale_jobs before it was done.
+    >>> from tempfile import TemporaryDirectory
+    >>> directory = TemporaryDirectory()
+    >>> create_jobs(directory.name, 4, shard_size=4)
+    1
+    >>> claim_path = claim_job(directory.name, "slow")
+    >>> requeue_stale_jobs(directory.name, 0)
+    1
+    >>> run_job(directory.name, claim_path, "slow", chunk_size=2)
+    False
+    >>> os.listdir(os.path.join(directory.name, "results"))
+    []
+    >>> directory.cleanup()"""
+    name = os.path.basename(claim_path)[: -len(worker_id) - 1]
+    shard = name[: -len(".json")]
+    partial_path = os.path.join(queue_dir, "results", f"{shard}.{worker_id}.partial")
+    try:
+        with open(claim_path) as file:
+            job = json.load(file)
+    except FileNotFoundError:
+        return False
+
+    pool = GamePool(
+        TranspositionCache() if cache else None, salvo=job["salvo"], metrics=metrics
+    )
+    with open(partial_path, "w") as results:
+        chunk = new_summary()
+        for game_num in range(job["games"]):
+            game, shots = play_bot_game(job["first_seed"] + game_num, pool=pool)
+            chunk["games"] += 1
+            chunk["wins"][0 if game.winner() == Player.ONE else 1] += 1
+            chunk["shots"] += shots
+            chunk["shots_histogram"][str(shots)] = (
+                chunk["shots_histogram"].get(str(shots), 0) + 1
+            )
+            pool.release(game)
+            if chunk["games"] == chunk_size or game_num == job["games"] - 1:
+                results.write(json.dumps(chunk) + "\n")
+                results.flush()
+                os.fsync(results.fileno())
+                chunk = new_summary()
+                # the claim's modification time doubles as the worker's heartbeat
+                try:
+                    os.utime(claim_path)
+                except FileNotFoundError:
+                    # requeued while this worker was slow, so another worker plays it
+                    break
+
+    try:
+        os.utime(claim_path)
+        os.replace(partial_path, os.path.join(queue_dir, "results", f"{shard}.jsonl"))
+        os.replace(claim_path, os.path.join(queue_dir, "done", name))
+    except FileNotFoundError:
+        _remove_partial(partial_path)
+        return False
+    return True
+
+
+def _remove_partial(partial_path: str) -> None:
+    try:
+        os.remove(partial_path)
+    except FileNotFoundError:
+        pass
+
+
+def work(
+    queue_dir: str,
+    worker_id: str | None = None,
+    chunk_size: int = 1000,
+    metrics: GameMetrics | None = None,
+    cache: bool = False,
+) -> int:
+    """Claims and plays work units until none are pending. Returns the number of work units played.
+    Any number of workers can share a queue, each in its own process:
+    >>> import subprocess, sys
+    >>> from tempfile import TemporaryDirectory
+    >>> directory = TemporaryDirectory()
+    >>> create_jobs(directory.name, 40, shard_size=5)
+    8
+    >>> workers = [
+    ...     subprocess.Popen(
+    ...         [sys.executable, __file__, "work", directory.name, "--chunk-size", "2"],
+    ...         stdout=subprocess.DEVNULL,
+    ...     )
+    ...     for __ in range(3)
+    ... ]
+    >>> [worker.wait() for worker in workers]
+    [0, 0, 0]
+    >>> total = merge_results(directory.name)
+    >>> total["games"], sum(total["wins"]), len(os.listdir(os.path.join(directory.name, "done")))
+    (40, 40, 8)
+    >>> directory.cleanup()"""
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    jobs = 0
+    while True:
+        claim_path = claim_job(queue_dir, worker_id)
+        if claim_path is None:
+            return jobs
+        if run_job(queue_dir, claim_path, worker_id, chunk_size, metrics, cache):
+            jobs += 1
+
+
+def requeue_stale_jobs(queue_dir: str, max_age: float) -> int:
+    """Puts work units whose worker hasn't checked in for max_age seconds back in pending, so a crashed
+    worker only loses the work unit it was playing, and removes the worker's partial results for them.
+    Returns the number of work units requeued."""
+    requeued = 0
+    claimed_dir = os.path.join(queue_dir, "claimed")
+    for claim in os.listdir(claimed_dir):
+        claim_path = os.path.join(claimed_dir, claim)
+        try:
+            if time() - os.path.getmtime(claim_path) < max_age:
+                continue
+            name = claim[: claim.index(".json") + len(".json")]
+            os.rename(claim_path, os.path.join(queue_dir, "pending", name))
+        except FileNotFoundError:
+            # the worker finished it in the meantime
+            continue
+        worker_id = claim[len(name) + 1 :]
+        _remove_partial(
+            os.path.join(
+                queue_dir,
+                "results",
+                f"{name[: -len('.json')]}.{worker_id}.partial",
+            )
+        )
+        requeued += 1
+    return requeued
+
+
+def merge_results(queue_dir: str) -> dict:
+    """Returns the statistics of every finished work unit added together."""
+    total = new_summary()
+    results_dir = os.path.join(queue_dir, "results")
+    for name in sorted(os.listdir(results_dir)):
+        if name.endswith(".jsonl"):
+            with open(os.path.join(results_dir, name)) as file:
+                for line in file:
+                    add_summary(total, json.loads(line))
+    return total
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Distribute bot vs bot games over a shared directory"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser("create", help="queue work units")
+    create_parser.add_argument("queue_dir")
+    create_parser.add_argument("--games", type=int, required=True)
+    create_parser.add_argument("--shard-size", type=int, default=10000)
+    create_parser.add_argument("--seed", type=int, default=0)
+    create_parser.add_argument("--salvo", action="store_true")
+    work_parser = subparsers.add_parser(
+        "work", help="play work units until none are left"
+    )
+    work_parser.add_argument("queue_dir")
+    work_parser.add_argument("--worker-id")
+    work_parser.add_argument("--chunk-size", type=int, default=1000)
+    work_parser.add_argument(
+        "--cache", action="store_true", help="reuse hunt distributions across games"
+    )
+    work_parser.add_argument(
+        "--metrics-file", help="export Prometheus metrics to this file while working"
+    )
+    work_parser.add_argument("--metrics-interval", type=float, default=15.0)
+    requeue_parser = subparsers.add_parser(
+        "requeue", help="requeue work units of dead workers"
+    )
+    requeue_parser.add_argument("queue_dir")
+    requeue_parser.add_argument("--max-age", type=float, default=600)
+    merge_parser = subparsers.add_parser("merge", help="print the merged statistics")
+    merge_parser.add_argument("queue_dir")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        count = create_jobs(
+            args.queue_dir, args.games, args.shard_size, args.seed, args.salvo
+        )
+        print(f"Queued {count} work units in {args.queue_dir}")
+    elif args.command == "work":
+        metrics = exporter = None
+        if args.metrics_file:
+            metrics = GameMetrics()
+            # labelled with the worker id so each worker's file can sit in one collector directory
+            exporter = MetricsExporter(
+                metrics, args.metrics_file, args.metrics_interval, args.worker_id
+            )
+            exporter.start()
+        count = work(
+            args.queue_dir, args.worker_id, args.chunk_size, metrics, args.cache
+        )
+        if exporter is not None:
+            exporter.stop()
+        print(f"Played {count} work units")
+    elif args.command == "requeue":
+        count = requeue_stale_jobs(args.queue_dir, args.max_age)
+        print(f"Requeued {count} work units")
+    else:
+        total = merge_results(args.queue_dir)
+        average = total["shots"] / total["games"] if total["games"] else 0
+        print(
+            f"{total['games']} games: player one won {total['wins'][0]}, player two won {total['wins'][1]}, "
+            f"{average:.1f} shots per game"
+        )
@@ -1,6 +1,7 @@
 from PySide6.QtGui import QHoverEvent, QFont
 from PySide6.QtWidgets import (
     QApplication,
+    QComboBox,
     QMainWindow,
     QLabel,
     QPushButton,
@@ -10,7 +11,9 @@ from PySide6.QtWidgets import (
 )
 from game_logic import *
 from bot_logic import *
+from placement_heatmap import PlacementHeatmap
 from PySide6.QtCore import Qt, QTimer
+from time import perf_counter
 
 # StyleSheets for the QPushButtons of the Battleship grid
 empty_stylesheet = "background-color: rgb(50, 132, 245); height: 30px; width: 30px; border: 2px solid black;"
@@ -26,6 +29,27 @@ invalid_hover_stylesheet = (
     "background-color: red; height: 30px; width: 30px; border: 2px solid black;"
 )
 hover_occupied_stylesheet = "background-color: rgb(191, 128, 128); height: 30px; width: 30px; border: 2px solid black;"
+anchor_stylesheet = "background-color: rgb(90, 160, 250); height: 30px; width: 30px; border: 2px solid black;"
+
+# how spaces look while two bots play each other, both fleets are shown
+spectator_styles = {
+    GridSpace.EMPTY: (" ", empty_stylesheet),
+    GridSpace.OCCUPIED: (" ", occupied_stylesheet),
+    GridSpace.MISS: ("O", miss_stylesheet),
+    GridSpace.HIT: ("O", opp_hit_stylesheet),
+    GridSpace.DESTROYED: ("X", opp_hit_stylesheet),
+}
+
+# moves per second for each spectator speed, None means as fast as possible
+spectator_speeds = {
+    "Real time": 0.5,
+    "Fast": 10,
+    "Very fast": 200,
+    "As fast as possible": None,
+}
+
+# where the bot keeps track of where players like to put their ships between games
+heatmap_path = "placement_heatmap.bin"
 
 
 class buttonWithID(QPushButton):
@@ -76,11 +100,19 @@ class BattleshipGUI(QMainWindow):
         self.Player_2_Field: list[list[buttonWithID]] = []
         self.size_num = size_num
         self.game = BattleshipGame()
+        # spaces the game's events say changed since they were last painted, as (player, row, column)
+        self._changed = set()
+        self._repaint_all = True
+        self.game.subscribe(self.game_event)
         self.orientation = Orientation.ACROSS
+        self.heatmap = PlacementHeatmap(heatmap_path)
+        # win_check can run more than once for a finished game, but its fleet is recorded only once
+        self._fleet_recorded = False
         self.virtual_player_2 = ComputerPlayer(
             self.game.player_two_board,
             self.game.player_one_board,
             self.game.player_one_ships,
+            heatmap=self.heatmap,
         )
         self.placed_ships = 0
         self.ships_indices_in_hand = [0, 1, 2, 3, 4]
@@ -90,6 +122,14 @@ class BattleshipGUI(QMainWindow):
         self.timer.setSingleShot(True)
         self.computer_place()
 
+        # bot vs bot games are played by spectator_timer and painted by paint_timer, at most once per frame
+        self.spectating = False
+        self.spectator_bots = None
+        self.spectator_timer = QTimer()
+        self.spectator_timer.timeout.connect(self.spectator_step)
+        self.paint_timer = QTimer()
+        self.paint_timer.timeout.connect(self.spectator_paint)
+
         # point of no return
         self.grid = QGridLayout()
         # sets up the foramting of the tic tac toe table interface
@@ -109,11 +149,15 @@ class BattleshipGUI(QMainWindow):
         font.setPointSize(11)
         self.turn_display = QLabel("Place your ships!")
         self.restart_button = QPushButton("Restart")
+        self.watch_button = QPushButton("Watch bots")
+        self.speed_box = QComboBox()
+        self.speed_box.addItems(list(spectator_speeds))
         self.last_strike.setFont(font)
         font.setBold(True)
         font.setPointSize(12)
         self.turn_display.setFont(font)
         self.restart_button.setFont(font)
+        self.watch_button.setFont(font)
         self.player_label_1.setAlignment(Qt.AlignCenter)
         self.player_label_2.setAlignment(Qt.AlignCenter)
         self.title.setAlignment(Qt.AlignCenter)
@@ -128,10 +172,14 @@ class BattleshipGUI(QMainWindow):
         info_layout.addWidget(self.restart_button, 0, 2, 1, 2)
         info_layout.addWidget(self.last_strike, 3, 0, 1, 6)
         info_layout.addWidget(self.turn_display, 1, 0, 1, 6)
+        info_layout.addWidget(self.watch_button, 4, 0, 1, 3)
+        info_layout.addWidget(self.speed_box, 4, 3, 1, 3)
         info_box.setLayout(info_layout)
         self.grid.addWidget(info_box, 2, 12, 4, 6)
 
         self.restart_button.clicked.connect(self.restart)
+        self.watch_button.clicked.connect(self.toggle_spectating)
+        self.speed_box.currentTextChanged.connect(self.change_speed)
 
         self.grid.addWidget(self.title, 0, 12, 1, 6)
         self.grid.addWidget(self.player_label_1, 1, 3, 1, 4)
@@ -185,6 +233,8 @@ class BattleshipGUI(QMainWindow):
                 )
                 self.placed_ships += 1
                 self.ship_index = 0
+                # the highlights for the ship that was in hand have to go as well
+                self._repaint_all = True
                 if self.placed_ships == 5:
                     self.turn_display.setText("It is your turn!")
                     for row_num, row in enumerate(self.Player_1_Field):
@@ -205,6 +255,9 @@ class BattleshipGUI(QMainWindow):
             self.timer.start(random() * 1500 + 1500)
 
     def win_check(self) -> bool:
+        if self.game.winner() is not None and not self._fleet_recorded:
+            self.heatmap.record(self.game.player_one_ships)
+            self._fleet_recorded = True
         if self.game.winner() == Player.ONE:
             alert = QMessageBox()
             alert.setText("You won!")
@@ -235,71 +288,74 @@ class BattleshipGUI(QMainWindow):
         ship_size = self.game.player_one_ships[
             self.ships_indices_in_hand[self.ship_index]
         ].size
-        if self.orientation == Orientation.ACROSS:
-            if coordinates[1] + ship_size <= 10 and all(
-                [
-                    self.game.player_one_board[coordinates[0]][coordinates[1] + pos]
-                    == GridSpace.EMPTY
-                    for pos in range(ship_size)
-                ]
-            ):
-                return True
-            else:
-                return False
+        return self.game.can_place_ship(
+            Player.ONE, ship_size, (coordinates[0], coordinates[1], self.orientation)
+        )
+
+    def empty_space_stylesheet(self, anchors: int, row_num: int, col_num: int) -> str:
+        # while placing ships, every space the ship in hand could be placed at is highlighted
+        if anchors >> (row_num * 10 + col_num) & 1:
+            return anchor_stylesheet
+        return empty_stylesheet
+
+    def game_event(self, event: GameEvent):
+        if event.kind == EventType.RESET:
+            self._repaint_all = True
+        elif event.player is not None:
+            self._changed.update(
+                (event.player, row, column) for row, column in event.cells
+            )
+
+    def changed_spaces(self) -> list[tuple[Player, int, int]]:
+        # the spaces to repaint, which then count as painted
+        if self._repaint_all:
+            spaces = [
+                (player, row, column)
+                for player in (Player.ONE, Player.TWO)
+                for row in range(self.size_num)
+                for column in range(self.size_num)
+            ]
         else:
-            if coordinates[0] + ship_size <= 10 and all(
-                [
-                    self.game.player_one_board[coordinates[0] + pos][coordinates[1]]
-                    == GridSpace.EMPTY
-                    for pos in range(ship_size)
-                ]
-            ):
-                return True
-            else:
-                return False
+            spaces = list(self._changed)
+        self._repaint_all = False
+        self._changed.clear()
+        return spaces
 
     def update_screen(self):
-        for row_num, row in enumerate(self.game.get_player_boards()[1]):
-            for col_num, space in enumerate(row):
+        for player, row_num, col_num in self.changed_spaces():
+            if player == Player.TWO:
+                space = self.game.player_two_board[row_num][col_num]
+                button = self.Player_2_Field[row_num][col_num]
                 if space == GridSpace.DESTROYED:
-                    self.Player_2_Field[row_num][col_num].setText("X")
-                    self.Player_2_Field[row_num][col_num].setStyleSheet(hit_stylesheet)
+                    button.setText("X")
+                    button.setStyleSheet(hit_stylesheet)
                 if space == GridSpace.MISS:
-                    self.Player_2_Field[row_num][col_num].setText("O")
-                    self.Player_2_Field[row_num][col_num].setStyleSheet(miss_stylesheet)
+                    button.setText("O")
+                    button.setStyleSheet(miss_stylesheet)
                 if space == GridSpace.HIT:
-                    self.Player_2_Field[row_num][col_num].setText("O")
-                    self.Player_2_Field[row_num][col_num].setStyleSheet(hit_stylesheet)
+                    button.setText("O")
+                    button.setStyleSheet(hit_stylesheet)
                 if space == GridSpace.EMPTY or space == GridSpace.OCCUPIED:
-                    self.Player_2_Field[row_num][col_num].setStyleSheet(
-                        empty_stylesheet
-                    )
-                    self.Player_2_Field[row_num][col_num].setText(" ")
-        for row_num, row in enumerate(self.game.get_player_boards()[0]):
-            for col_num, space in enumerate(row):
+                    button.setStyleSheet(empty_stylesheet)
+                    button.setText(" ")
+            else:
+                space = self.game.player_one_board[row_num][col_num]
+                button = self.Player_1_Field[row_num][col_num]
                 if space == GridSpace.DESTROYED:
-                    self.Player_1_Field[row_num][col_num].setText("X")
-                    self.Player_1_Field[row_num][col_num].setStyleSheet(
-                        opp_hit_stylesheet
-                    )
+                    button.setText("X")
+                    button.setStyleSheet(opp_hit_stylesheet)
                 if space == GridSpace.MISS:
-                    self.Player_1_Field[row_num][col_num].setText("O")
-                    self.Player_1_Field[row_num][col_num].setStyleSheet(miss_stylesheet)
+                    button.setText("O")
+                    button.setStyleSheet(miss_stylesheet)
                 if space == GridSpace.HIT:
-                    self.Player_1_Field[row_num][col_num].setText("O")
-                    self.Player_1_Field[row_num][col_num].setStyleSheet(
-                        opp_hit_stylesheet
-                    )
+                    button.setText("O")
+                    button.setStyleSheet(opp_hit_stylesheet)
                 if space == GridSpace.OCCUPIED:
-                    self.Player_1_Field[row_num][col_num].setText(" ")
-                    self.Player_1_Field[row_num][col_num].setStyleSheet(
-                        occupied_stylesheet
-                    )
+                    button.setText(" ")
+                    button.setStyleSheet(occupied_stylesheet)
                 if space == GridSpace.EMPTY:
-                    self.Player_1_Field[row_num][col_num].setText(" ")
-                    self.Player_1_Field[row_num][col_num].setStyleSheet(
-                        empty_stylesheet
-                    )
+                    button.setText(" ")
+                    button.setStyleSheet(empty_stylesheet)
 
     def computer_place(self):
         for pos, ship in enumerate(self.game.player_two_ships):
@@ -330,25 +386,166 @@ class BattleshipGUI(QMainWindow):
             )
             == QMessageBox.Yes
         ):
-            self.turn_display.setText("Place your ships!")
-            self.last_strike.setText("Waiting for someone to make a move!")
-
-            for row_num, row in enumerate(self.game.get_player_boards()[1]):
-                for col_num, space in enumerate(row):
-                    self.Player_2_Field[row_num][col_num].setEnabled(False)
-            for row_num, row in enumerate(self.game.get_player_boards()[0]):
-                for col_num, space in enumerate(row):
-                    self.Player_1_Field[row_num][col_num].setEnabled(True)
-            self.game.reset()
-            self.virtual_player_2 = ComputerPlayer(
-                self.game.player_two_board,
-                self.game.player_one_board,
-                self.game.player_two_ships,
+            if self.spectating:
+                self.stop_spectating()
+            else:
+                self.reset_game()
+
+    def reset_game(self):
+        self.turn_display.setText("Place your ships!")
+        self.last_strike.setText("Waiting for someone to make a move!")
+
+        for row_num, row in enumerate(self.game.get_player_boards()[1]):
+            for col_num, space in enumerate(row):
+                self.Player_2_Field[row_num][col_num].setEnabled(False)
+        for row_num, row in enumerate(self.game.get_player_boards()[0]):
+            for col_num, space in enumerate(row):
+                self.Player_1_Field[row_num][col_num].setEnabled(True)
+        self.timer.stop()
+        # the game and bot are reset in place rather than rebuilt
+        self.game.reset()
+        self._fleet_recorded = False
+        self.virtual_player_2.reset(self.heatmap)
+        self.computer_place()
+        self.update_screen()
+        self.placed_ships = 0
+        self.ships_indices_in_hand = [0, 1, 2, 3, 4]
+
+    def toggle_spectating(self):
+        if self.spectating:
+            self.stop_spectating()
+        else:
+            self.start_spectating()
+
+    def start_spectating(self):
+        # two ComputerPlayers play each other until stop_spectating is called
+        self.timer.stop()
+        self.spectating = True
+        self.spectated_games = 0
+        self.spectator_wins = {Player.ONE: 0, Player.TWO: 0}
+        self.spectator_shots = 0
+        self.watch_button.setText("Stop watching")
+        self.player_label_1.setText("Bot 1")
+        self.player_label_2.setText("Bot 2")
+        self.last_strike.setText("Waiting for someone to make a move!")
+        for row_num, row in enumerate(self.Player_1_Field):
+            for col_num, button in enumerate(row):
+                button.setEnabled(False)
+                self.Player_2_Field[row_num][col_num].setEnabled(False)
+        if self.spectator_bots is None:
+            self.spectator_bots = {
+                Player.ONE: ComputerPlayer(
+                    self.game.player_one_board,
+                    self.game.player_two_board,
+                    self.game.player_two_ships,
+                    game=self.game,
+                ),
+                Player.TWO: ComputerPlayer(
+                    self.game.player_two_board,
+                    self.game.player_one_board,
+                    self.game.player_one_ships,
+                    game=self.game,
+                ),
+            }
+        self.new_spectator_game()
+        self._painted = {}
+        self._moves_due = 0.0
+        self._last_tick = perf_counter()
+        self.change_speed()
+        refresh_rate = self.screen().refreshRate() if self.screen() else 60
+        self.paint_timer.start(max(1, int(1000 / refresh_rate)))
+
+    def stop_spectating(self):
+        self.spectator_timer.stop()
+        self.paint_timer.stop()
+        self.spectating = False
+        self.watch_button.setText("Watch bots")
+        self.player_label_1.setText("You")
+        self.player_label_2.setText("Player 2")
+        self.reset_game()
+
+    def change_speed(self):
+        if not self.spectating:
+            return
+        speed = spectator_speeds[self.speed_box.currentText()]
+        self._moves_due = 0.0
+        self._last_tick = perf_counter()
+        if speed is None:
+            self.spectator_timer.start(0)
+        else:
+            self.spectator_timer.start(max(1, min(100, int(1000 / speed))))
+
+    def new_spectator_game(self):
+        self.game.reset()
+        for bot in self.spectator_bots.values():
+            bot.reset()
+        for player, ships in (
+            (Player.ONE, self.game.player_one_ships),
+            (Player.TWO, self.game.player_two_ships),
+        ):
+            for pos, ship in enumerate(ships):
+                self.game.place_ship(
+                    player, pos, self.spectator_bots[player].place_ship(ship)
+                )
+        self.spectator_game_shots = 0
+
+    def spectator_step(self):
+        # plays the moves that are due at the selected speed, painting is left to spectator_paint
+        now = perf_counter()
+        speed = spectator_speeds[self.speed_box.currentText()]
+        if speed is None:
+            # keep each batch short so the window stays responsive
+            while perf_counter() - now < 0.01:
+                self.spectator_move()
+        else:
+            # never fall more than a second behind if the moves can't keep up
+            self._moves_due = min(
+                self._moves_due + (now - self._last_tick) * speed, speed + 1
             )
-            self.computer_place()
-            self.update_screen()
-            self.placed_ships = 0
-            self.ships_indices_in_hand = [0, 1, 2, 3, 4]
+            while self._moves_due >= 1:
+                self._moves_due -= 1
+                self.spectator_move()
+        self._last_tick = now
+
+    def spectator_move(self):
+        bot = self.spectator_bots[self.game.turn]
+        coordinate_tuple = bot.strike_coordinates()
+        self.game.attempt_strike(coordinate_tuple)
+        bot.update_weights()
+        self.spectator_game_shots += 1
+        winner = self.game.winner()
+        if winner is not None:
+            self.spectated_games += 1
+            self.spectator_wins[winner] += 1
+            self.spectator_shots += self.spectator_game_shots
+            self.last_strike.setText(
+                f"Bot {1 if winner == Player.ONE else 2} won game {self.spectated_games} "
+                f"in {self.spectator_game_shots} shots "
+                f"({self.spectator_shots / self.spectated_games:.1f} on average)"
+            )
+            self.new_spectator_game()
+
+    def spectator_paint(self):
+        # repaints only the spaces that changed, and only if a move was made since the last frame
+        if not self._changed and not self._repaint_all:
+            return
+        for player, row_num, col_num in self.changed_spaces():
+            if player == Player.ONE:
+                space = self.game.player_one_board[row_num][col_num]
+                button = self.Player_1_Field[row_num][col_num]
+            else:
+                space = self.game.player_two_board[row_num][col_num]
+                button = self.Player_2_Field[row_num][col_num]
+            # a new game makes every space count as changed, but most of them look the same as before
+            if self._painted.get((player, row_num, col_num)) != space:
+                self._painted[(player, row_num, col_num)] = space
+                text, stylesheet = spectator_styles[space]
+                button.setText(text)
+                button.setStyleSheet(stylesheet)
+        self.turn_display.setText(
+            f"Game {self.spectated_games + 1}: Bot 1 has won {self.spectator_wins[Player.ONE]}, "
+            f"Bot 2 has won {self.spectator_wins[Player.TWO]}"
+        )
 
     def mouse_scroll(self, event) -> bool:
         if event.angleDelta().y() < 0:
@@ -365,12 +562,17 @@ class BattleshipGUI(QMainWindow):
     def button_hover(
         self, position: tuple[int, int, Player], event: QHoverEvent = None
     ):
+        if self.spectating:
+            return
         # mouse hover enter event
         if event == None or event.type() == 129:
             if self.placed_ships < 5:
                 ship_size = self.game.player_one_ships[
                     self.ships_indices_in_hand[self.ship_index]
                 ].size
+                anchors = self.game.legal_anchors(
+                    Player.ONE, ship_size, self.orientation
+                )
                 if position[2] == Player.ONE and self.can_place_ship_at_coordinates(
                     position[:2]
                 ):
@@ -380,7 +582,11 @@ class BattleshipGUI(QMainWindow):
                                 self.game.player_one_board[row_num][col_num]
                                 == GridSpace.EMPTY
                             ):
-                                button.setStyleSheet(empty_stylesheet)
+                                button.setStyleSheet(
+                                    self.empty_space_stylesheet(
+                                        anchors, row_num, col_num
+                                    )
+                                )
                     for pos in range(ship_size):
                         if self.orientation == Orientation.ACROSS:
                             self.Player_1_Field[position[0]][
@@ -397,7 +603,11 @@ class BattleshipGUI(QMainWindow):
                                 self.game.player_one_board[row_num][col_num]
                                 == GridSpace.EMPTY
                             ):
-                                button.setStyleSheet(empty_stylesheet)
+                                button.setStyleSheet(
+                                    self.empty_space_stylesheet(
+                                        anchors, row_num, col_num
+                                    )
+                                )
                     for pos in range(ship_size):
                         if self.orientation == Orientation.ACROSS:
                             if position[1] + pos <= 9:
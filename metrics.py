@@ -0,0 +1,206 @@
+import os
+import socket
+from bisect import bisect_left
+from threading import Event, Lock, Thread, local
+
+# upper bounds, in seconds, of the bot decision time histogram buckets
+DECISION_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+DECISION_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _new_shard() -> dict:
+    return {
+        "games": 0,
+        "shots": 0,
+        "shots_to_win": 0,
+        "hits": {},
+        "decisions": [0] * (len(DECISION_BUCKETS) + 1),
+        "decision_seconds": 0.0,
+    }
+
+
+class GameMetrics:
+    """Running counters of games, shots, hits and bot decision times.
+    Each thread counts into its own shard, so recording never waits on a lock; shards are only added
+    together when the metrics are read."""
+
+    def __init__(self):
+        self._shards = []
+        self._shards_lock = Lock()
+        self._local = local()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _new_shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record_strike(self, hit_ship_size: int | None) -> None:
+        """Counts a strike, and a hit on a Ship of hit_ship_size unless it is None."""
+        shard = self._shard()
+        shard["shots"] += 1
+        if hit_ship_size is not None:
+            shard["hits"][hit_ship_size] = shard["hits"].get(hit_ship_size, 0) + 1
+
+    def record_game(self, shots_to_win: int) -> None:
+        """Counts a completed game that the winner needed shots_to_win shots for."""
+        shard = self._shard()
+        shard["games"] += 1
+        shard["shots_to_win"] += shots_to_win
+
+    def record_decision(self, seconds: float) -> None:
+        """Counts a bot decision that took the given number of seconds."""
+        shard = self._shard()
+        shard["decisions"][bisect_left(DECISION_BUCKETS, seconds)] += 1
+        shard["decision_seconds"] += seconds
+
+    def totals(self) -> dict:
+        """Returns every shard added together."""
+        total = _new_shard()
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            total["games"] += shard["games"]
+            total["shots"] += shard["shots"]
+            total["shots_to_win"] += shard["shots_to_win"]
+            for size, hits in list(shard["hits"].items()):
+                total["hits"][size] = total["hits"].get(size, 0) + hits
+            for bucket, count in enumerate(shard["decisions"]):
+                total["decisions"][bucket] += count
+            total["decision_seconds"] += shard["decision_seconds"]
+        return total
+
+    def decision_quantile(self, quantile: float, totals: dict | None = None) -> float:
+        """Returns an estimate of the given quantile of bot decision times: the upper bound of the bucket it falls in."""
+        decisions = (totals or self.totals())["decisions"]
+        rank = quantile * sum(decisions)
+        seen = 0
+        for bucket, count in enumerate(decisions):
+            seen += count
+            if count and seen >= rank:
+                return (
+                    DECISION_BUCKETS[bucket]
+                    if bucket < len(DECISION_BUCKETS)
+                    else float("inf")
+                )
+        return 0.0
+
+    def prometheus_text(self, instance: str | None = None) -> str:
+        """Returns the metrics in the Prometheus text exposition format, labelled with instance."""
+        if instance is None:
+            instance = f"{socket.gethostname()}-{os.getpid()}"
+        label = f'instance="{instance}"'
+        totals = self.totals()
+        lines = [
+            "# HELP seastrike_games_completed_total Games that have been won.",
+            "# TYPE seastrike_games_completed_total counter",
+            f"seastrike_games_completed_total{{{label}}} {totals['games']}",
+            "# HELP seastrike_shots_fired_total Strikes resolved by the game.",
+            "# TYPE seastrike_shots_fired_total counter",
+            f"seastrike_shots_fired_total{{{label}}} {totals['shots']}",
+            "# HELP seastrike_hits_total Strikes that hit a ship, by ship size.",
+            "# TYPE seastrike_hits_total counter",
+        ]
+        for size in sorted(totals["hits"]):
+            lines.append(
+                f'seastrike_hits_total{{{label},ship_size="{size}"}} {totals["hits"][size]}'
+            )
+        average = totals["shots_to_win"] / totals["games"] if totals["games"] else 0.0
+        lines += [
+            "# HELP seastrike_shots_to_win_average Average shots the winner needed.",
+            "# TYPE seastrike_shots_to_win_average gauge",
+            f"seastrike_shots_to_win_average{{{label}}} {average}",
+            "# HELP seastrike_decision_seconds Time the bot took to choose a strike.",
+            "# TYPE seastrike_decision_seconds histogram",
+        ]
+        cumulative = 0
+        for bucket, bound in enumerate(DECISION_BUCKETS):
+            cumulative += totals["decisions"][bucket]
+            lines.append(
+                f'seastrike_decision_seconds_bucket{{{label},le="{bound}"}} {cumulative}'
+            )
+        cumulative += totals["decisions"][-1]
+        lines += [
+            f'seastrike_decision_seconds_bucket{{{label},le="+Inf"}} {cumulative}',
+            f"seastrike_decision_seconds_sum{{{label}}} {totals['decision_seconds']}",
+            f"seastrike_decision_seconds_count{{{label}}} {cumulative}",
+            "# HELP seastrike_decision_seconds_quantile Estimated bot decision time percentiles.",
+            "# TYPE seastrike_decision_seconds_quantile gauge",
+        ]
+        for quantile in DECISION_QUANTILES:
+            lines.append(
+                f'seastrike_decision_seconds_quantile{{{label},quantile="{quantile}"}} '
+                f"{self.decision_quantile(quantile, totals)}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def __repr__(self) -> str:
+        return f"GameMetrics()"
+
+
+class MetricsExporter:
+    """Writes a GameMetrics to a file in the Prometheus text format every interval seconds from a background thread.
+    Give each process its own file, for example in a node_exporter textfile collector
+    directory."""
+
+    def __init__(
+        self,
+        metrics: GameMetrics,
+        path: str,
+        interval: float = 15.0,
+        instance: str | None = None,
+    ):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.instance = instance
+        self._stopped = Event()
+        self._thread = None
+
+    def export(self) -> None:
+        """Writes the metrics now. The file is replaced atomically so scrapers never see half of it."""
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.metrics.prometheus_text(self.instance))
+        os.replace(temp_path, self.path)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.export()
+
+    def start(self) -> None:
+        """Starts exporting periodically."""
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops exporting, after writing the final values."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def __repr__(self) -> str:
+        return f"MetricsExporter({self.path!r})"
@@ -0,0 +1,146 @@
+from mmap import mmap, ACCESS_READ
+from os import replace
+from struct import Struct
+
+# header: magic, version, board size, number of ships, then the fleet sizes,
+# then the prior key, the number of shots covered and the number of entries
+_MAGIC = b"SSOB"
+_VERSION = 1
+_HEADER_START = Struct("<4sHBB")
+_HEADER_END = Struct("<qHI")
+# index entry: board hash, smallest ship size, option count, data offset
+_INDEX_ENTRY = Struct("<QBHI")
+# data entry: cell index (row * size + column), weight
+_OPTION = Struct("<Bd")
+
+
+class OpeningBook:
+    """A read-only opening book mapping early hunt-mode board states to targeting distributions.
+    The file is memory-mapped the first time it is needed, so creating one is free."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.board_size = None
+        self.fleet = None
+        self.prior_key = None
+        self.max_shots = 0
+        self._file = None
+        self._map = None
+        self._entry_count = 0
+        self._index_start = 0
+        self._loaded = False
+
+    def _load(self) -> None:
+        """Maps the book into memory and reads its header. A missing book is treated as empty."""
+        self._loaded = True
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+        magic, version, self.board_size, fleet_length = _HEADER_START.unpack_from(
+            self._map, 0
+        )
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{self.path} is not a SeaStrike opening book.")
+        offset = _HEADER_START.size
+        self.fleet = tuple(self._map[offset : offset + fleet_length])
+        offset += fleet_length
+        self.prior_key, self.max_shots, self._entry_count = _HEADER_END.unpack_from(
+            self._map, offset
+        )
+        self._index_start = offset + _HEADER_END.size
+
+    def matches(self, board_size: int, fleet: tuple[int, ...], prior_key: int) -> bool:
+        """Returns True if the book was built for the given board size, fleet and prior weights."""
+        if not self._loaded:
+            self._load()
+        return (
+            self._map is not None
+            and self.board_size == board_size
+            and self.fleet == tuple(fleet)
+            and self.prior_key == prior_key
+        )
+
+    def lookup(
+        self, board_hash: int, smallest_ship_size: int
+    ) -> tuple[list[tuple[int, int]], list[float]] | None:
+        """Returns the stored (options, weights) distribution for the given state, or None if the book has no entry."""
+        if not self._loaded:
+            self._load()
+        if self._map is None:
+            return None
+
+        target = (board_hash, smallest_ship_size)
+        low, high = 0, self._entry_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = _INDEX_ENTRY.unpack_from(
+                self._map, self._index_start + middle * _INDEX_ENTRY.size
+            )
+            if entry[:2] < target:
+                low = middle + 1
+            elif entry[:2] > target:
+                high = middle
+            else:
+                options = []
+                weights = []
+                for cell, weight in _OPTION.iter_unpack(
+                    self._map[entry[3] : entry[3] + entry[2] * _OPTION.size]
+                ):
+                    options.append(divmod(cell, self.board_size))
+                    weights.append(weight)
+                return (options, weights)
+        return None
+
+    def close(self) -> None:
+        """Unmaps the book. It will be mapped again if it is used afterwards."""
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = None
+        self._file = None
+        self._loaded = False
+
+    def __len__(self) -> int:
+        if not self._loaded:
+            self._load()
+        return self._entry_count
+
+    def __repr__(self) -> str:
+        return f"OpeningBook({self.path!r})"
+
+
+def write_opening_book(
+    path: str,
+    entries: dict[tuple[int, int], tuple[list[tuple[int, int]], list[float]]],
+    board_size: int,
+    fleet: tuple[int, ...],
+    prior_key: int,
+    max_shots: int,
+) -> None:
+    """Writes entries, a dict from (board hash, smallest ship size) to (options, weights), as an opening book at path.
+    The book is written to a temporary file first, so readers never see part of one."""
+    keys = sorted(entries)
+    header = (
+        _HEADER_START.pack(_MAGIC, _VERSION, board_size, len(fleet))
+        + bytes(fleet)
+        + _HEADER_END.pack(prior_key, max_shots, len(keys))
+    )
+    data_offset = len(header) + len(keys) * _INDEX_ENTRY.size
+    index = bytearray()
+    data = bytearray()
+    for board_hash, smallest_ship_size in keys:
+        options, weights = entries[(board_hash, smallest_ship_size)]
+        index += _INDEX_ENTRY.pack(
+            board_hash, smallest_ship_size, len(options), data_offset + len(data)
+        )
+        for (row, column), weight in zip(options, weights):
+            data += _OPTION.pack(row * board_size + column, weight)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(header)
+        file.write(index)
+        file.write(data)
+    replace(temp_path, path)
@@ -0,0 +1,92 @@
+from mmap import mmap
+from os import path as os_path
+from game_logic import Ship
+
+# Windows has no fcntl, so records from concurrent processes may race there
+try:
+    from fcntl import lockf, LOCK_EX, LOCK_UN
+except ImportError:
+    lockf = None
+
+# the counts are unsigned 64-bit integers, slot 0 holds the number of games recorded
+_COUNT_SIZE = 8
+
+
+class PlacementHeatmap:
+    """Persistent counts of where opponents have placed their ships, kept in a memory-mapped file.
+    Recording a game only touches the counters of the cells its ships occupy, so the file is never rewritten
+    and any number of processes can share it."""
+
+    def __init__(self, path: str, board_size: int = 10):
+        self.path = path
+        self.board_size = board_size
+        self._file = None
+        self._map = None
+        self._counts = None
+
+    def _open(self) -> None:
+        """Maps the counts file into memory, creating it full of zeroes if it does not exist yet."""
+        length = (self.board_size * self.board_size + 1) * _COUNT_SIZE
+        if not os_path.exists(self.path):
+            with open(self.path, "ab") as file:
+                file.truncate(length)
+        self._file = open(self.path, "r+b")
+        self._map = mmap(self._file.fileno(), length)
+        self._counts = memoryview(self._map).cast("Q")
+
+    def record(self, ships: list[Ship]) -> None:
+        """Adds the cells occupied by the given placed Ships to the counts."""
+        if self._counts is None:
+            self._open()
+        if lockf is not None:
+            lockf(self._file, LOCK_EX)
+        try:
+            for ship in ships:
+                for row, column in ship.spaces_occupied:
+                    self._counts[row * self.board_size + column + 1] += 1
+            # a crash partway through can leave some of a game's cells counted without the game itself
+            self._counts[0] += 1
+        finally:
+            if lockf is not None:
+                lockf(self._file, LOCK_UN)
+
+    def games(self) -> int:
+        """Returns the number of games recorded."""
+        if self._counts is None:
+            self._open()
+        return self._counts[0]
+
+    def counts(self) -> list[int]:
+        """Returns how many times each cell was occupied, in row-major order."""
+        if self._counts is None:
+            self._open()
+        return self._counts[1:].tolist()
+
+    def prior(self, base_weights: list[float], strength: float = 50.0) -> list[float]:
+        """Returns base_weights blended with the observed placement frequencies.
+        The more games recorded compared to strength, the more the frequencies count."""
+        games = self.games()
+        if games == 0:
+            return list(base_weights)
+        # add-one smoothing keeps cells that were never used from being ruled out entirely
+        frequencies = [count + 1 for count in self.counts()]
+        scale = sum(base_weights) / sum(frequencies)
+        blend = games / (games + strength)
+        return [
+            (1 - blend) * weight + blend * frequency * scale
+            for weight, frequency in zip(base_weights, frequencies)
+        ]
+
+    def close(self) -> None:
+        """Flushes and unmaps the counts file."""
+        if self._map is not None:
+            self._counts.release()
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+        self._file = None
+        self._map = None
+        self._counts = None
+
+    def __repr__(self) -> str:
+        return f"PlacementHeatmap({self.path!r})"
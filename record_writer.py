@@ -0,0 +1,266 @@
+import json
+import os
+import zlib
+from queue import Empty, Full, Queue
+from struct import Struct
+from threading import Lock, Thread
+from time import monotonic
+from game_logic import BattleshipGame
+
+# A record file is a sequence of blocks, each a header followed by zlib-compressed JSON lines, one per game.
+# header: magic, number of games, compressed length, CRC-32 of the compressed data
+_MAGIC = b"SSRB"
+_BLOCK_HEADER = Struct("<4sIII")
+
+# when the writer calls fsync: after every block, at most once per fsync_interval seconds, or only on close
+FSYNC_POLICIES = ("block", "interval", "close")
+
+# put on the queue by close to stop the writer thread
+_STOP = object()
+
+# how long a blocked submit waits for room before checking that the writer thread is still running
+_PUT_TIMEOUT = 0.1
+
+
+class GameRecordWriter:
+    """Appends game histories to a record file from a background thread, so archiving never waits on the disk.
+    Games are queued by submit, and the thread packs up to block_size of them into one compressed block, or fewer
+    if no more arrive for max_delay seconds. The queue holds at most max_queued games; when it is full, submit
+    waits for room, or drops the game if block is False.
+    A block left incomplete at the end of the file by a crash is cut off before new blocks are appended.
+    >>> from tempfile import TemporaryDirectory
+    >>> directory = TemporaryDirectory()
+    >>> path = os.path.join(directory.name, "games.bin")
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.submit({"winner": 1})
+    True
+    >>> with open(path, "r+b") as file:
+    ...     size = file.truncate(os.path.getsize(path) - 5)
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.submit({"winner": 2})
+    True
+    >>> list(read_records(path))
+    [{'winner': 2}]
+    >>> directory.cleanup()"""
+
+    def __init__(
+        self,
+        path: str,
+        block_size: int = 256,
+        max_queued: int = 4096,
+        max_delay: float = 1.0,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        compression_level: int = 6,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.path = path
+        self.block_size = block_size
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compression_level = compression_level
+        self._queue = Queue(max_queued)
+        self._stats_lock = Lock()
+        self._submitted = 0
+        self._dropped = 0
+        self._written = 0
+        self._blocks = 0
+        self._raw_bytes = 0
+        self._compressed_bytes = 0
+        self._started = monotonic()
+        self._last_fsync = self._started
+        self._error = None
+        self._closed = False
+        self._file = open(path, "ab")
+        self._truncate_torn_block()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, game: BattleshipGame | dict, block: bool = True) -> bool:
+        """Queues a game, or a record from BattleshipGame.history, to be written. The record is serialized right
+        away, so the game can be reset or reused as soon as this returns. Returns False if the game was dropped.
+        Raises a ValueError if the writer is closed, a TypeError if the record can't be stored as JSON, and the
+        writer thread's error if it has stopped."""
+        self._check_running()
+        record = game.history() if isinstance(game, BattleshipGame) else game
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        if not self._put(line, block):
+            with self._stats_lock:
+                self._dropped += 1
+            return False
+        with self._stats_lock:
+            self._submitted += 1
+        return True
+
+    def _check_running(self) -> None:
+        if self._closed:
+            raise ValueError(f"{self!r} is closed.")
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, item, block: bool) -> bool:
+        """Puts item on the queue, waiting for room if block is True, but never after the writer thread stops.
+        Returns False if the queue was full and block is False."""
+        if not block:
+            try:
+                self._queue.put(item, False)
+            except Full:
+                return False
+            return True
+        while True:
+            try:
+                self._queue.put(item, timeout=_PUT_TIMEOUT)
+            except Full:
+                if self._error is not None:
+                    raise self._error
+                if not self._thread.is_alive():
+                    raise RuntimeError(f"The writer thread of {self!r} has stopped.")
+            else:
+                return True
+
+    def _truncate_torn_block(self) -> None:
+        """Cuts the file back to the end of its last complete block."""
+        end = 0
+        with open(self.path, "rb") as file:
+            for end, __, __ in _read_blocks(file, self.path):
+                pass
+        if end != os.path.getsize(self.path):
+            self._file.truncate(end)
+
+    def _run(self) -> None:
+        batch = []
+        stopping = False
+        while not stopping:
+            try:
+                record = self._queue.get(timeout=self.max_delay if batch else None)
+            except Empty:
+                # nothing more arrived in time, so the partial block goes out
+                record = None
+            if record is _STOP:
+                stopping = True
+            elif record is not None:
+                batch.append(record)
+                if len(batch) < self.block_size:
+                    continue
+            if batch:
+                try:
+                    self._write_block(batch)
+                except Exception as error:
+                    # kept for submit and close to raise, so a failed writer is never silent
+                    self._error = error
+                    return
+                batch = []
+
+    def _write_block(self, batch: list[bytes]) -> None:
+        raw = b"".join(batch)
+        data = zlib.compress(raw, self.compression_level)
+        self._file.write(
+            _BLOCK_HEADER.pack(_MAGIC, len(batch), len(data), zlib.crc32(data))
+        )
+        self._file.write(data)
+        self._file.flush()
+        now = monotonic()
+        if self.fsync == "block" or (
+            self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval
+        ):
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+        with self._stats_lock:
+            self._written += len(batch)
+            self._blocks += 1
+            self._raw_bytes += len(raw)
+            self._compressed_bytes += _BLOCK_HEADER.size + len(data)
+
+    def stats(self) -> dict[str, float]:
+        """Returns the queue depth and how many games, blocks and bytes have been written so far, and how fast."""
+        with self._stats_lock:
+            elapsed = monotonic() - self._started
+            return {
+                "queued": self._queue.qsize(),
+                "submitted": self._submitted,
+                "dropped": self._dropped,
+                "written": self._written,
+                "blocks": self._blocks,
+                "raw_bytes": self._raw_bytes,
+                "compressed_bytes": self._compressed_bytes,
+                "games_per_second": self._written / elapsed if elapsed else 0.0,
+                "bytes_per_second": (
+                    self._compressed_bytes / elapsed if elapsed else 0.0
+                ),
+            }
+
+    def close(self) -> None:
+        """Writes every queued game, syncs the file to disk and stops the writer thread.
+        Raises the writer thread's error if it stopped before writing every game."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._thread.is_alive():
+                self._put(_STOP, True)
+                self._thread.join()
+        finally:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "GameRecordWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"GameRecordWriter({self.path!r})"
+
+
+def _read_blocks(file, path: str):
+    """Yields the end offset, game count and compressed data of each block of an open record file.
+    A block cut short by a crash, or a last block that fails its checksum, ends the file; any other block that
+    fails its checksum raises a ValueError."""
+    while True:
+        header = file.read(_BLOCK_HEADER.size)
+        if len(header) < _BLOCK_HEADER.size:
+            return
+        magic, count, length, checksum = _BLOCK_HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a SeaStrike record file.")
+        data = file.read(length)
+        if len(data) < length:
+            return
+        if zlib.crc32(data) != checksum:
+            if file.read(1) == b"":
+                return
+            raise ValueError(f"A block of {path} is corrupt.")
+        yield (file.tell(), count, data)
+
+
+def read_records(path: str):
+    """Yields every game record in the record file at path, in the order they were written.
+    A block cut short by a crash ends the file; a corrupt block raises a ValueError.
+    >>> from tempfile import TemporaryDirectory
+    >>> directory = TemporaryDirectory()
+    >>> path = os.path.join(directory.name, "games.bin")
+    >>> with GameRecordWriter(path, block_size=2) as writer:
+    ...     [writer.submit({"game": game_num}) for game_num in range(3)]
+    [True, True, True]
+    >>> [record["game"] for record in read_records(path)]
+    [0, 1, 2]
+    >>> directory.cleanup()"""
+    with open(path, "rb") as file:
+        for __, count, data in _read_blocks(file, path):
+            lines = zlib.decompress(data).decode().splitlines()
+            if len(lines) != count:
+                raise ValueError(f"A block of {path} is corrupt.")
+            for line in lines:
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    from doctest import testmod
+
+    testmod()
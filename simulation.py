@@ -0,0 +1,226 @@
+import random
+from argparse import ArgumentParser
+from game_logic import BattleshipGame, FLEET_SIZES, Player
+from bot_logic import ComputerPlayer, TranspositionCache
+from metrics import GameMetrics, MetricsExporter
+from opening_book import OpeningBook, write_opening_book
+from record_writer import GameRecordWriter
+
+
+def new_bot_game(
+    cache: TranspositionCache | None = None,
+    opening_book: OpeningBook | None = None,
+    salvo: bool = False,
+    metrics: GameMetrics | None = None,
+) -> tuple[BattleshipGame, ComputerPlayer, ComputerPlayer]:
+    """Returns a new game with both fleets placed and the two ComputerPlayers playing it.
+    If metrics is given, the game and both ComputerPlayers record into it."""
+    game = BattleshipGame(salvo, metrics)
+    bot_one = ComputerPlayer(
+        game.player_one_board,
+        game.player_two_board,
+        game.player_two_ships,
+        cache=cache,
+        game=game,
+        opening_book=opening_book,
+        metrics=metrics,
+    )
+    bot_two = ComputerPlayer(
+        game.player_two_board,
+        game.player_one_board,
+        game.player_one_ships,
+        cache=cache,
+        game=game,
+        opening_book=opening_book,
+        metrics=metrics,
+    )
+    for pos, ship in enumerate(game.player_one_ships):
+        game.place_ship(Player.ONE, pos, bot_one.place_ship(ship))
+    for pos, ship in enumerate(game.player_two_ships):
+        game.place_ship(Player.TWO, pos, bot_two.place_ship(ship))
+    return (game, bot_one, bot_two)
+
+
+class GamePool:
+    """A pool of reusable games, each with its two ComputerPlayers, for long simulation or server loops.
+    Released games are reset in place and handed out again, not reallocated."""
+
+    def __init__(
+        self,
+        cache: TranspositionCache | None = None,
+        opening_book: OpeningBook | None = None,
+        salvo: bool = False,
+        metrics: GameMetrics | None = None,
+    ):
+        self.cache = cache
+        self.opening_book = opening_book
+        self.salvo = salvo
+        self.metrics = metrics
+        self._bots = {}
+        self._free = []
+
+    def acquire(self) -> tuple[BattleshipGame, ComputerPlayer, ComputerPlayer]:
+        """Returns a game with both fleets placed and the two ComputerPlayers playing it."""
+        if len(self._free) == 0:
+            game, bot_one, bot_two = new_bot_game(
+                self.cache, self.opening_book, self.salvo, self.metrics
+            )
+            self._bots[id(game)] = (game, bot_one, bot_two)
+            return (game, bot_one, bot_two)
+
+        game, bot_one, bot_two = self._bots[id(self._free.pop())]
+        game.reset()
+        bot_one.reset()
+        bot_two.reset()
+        for pos, ship in enumerate(game.player_one_ships):
+            game.place_ship(Player.ONE, pos, bot_one.place_ship(ship))
+        for pos, ship in enumerate(game.player_two_ships):
+            game.place_ship(Player.TWO, pos, bot_two.place_ship(ship))
+        return (game, bot_one, bot_two)
+
+    def release(self, game: BattleshipGame) -> None:
+        """Gives a game from acquire back to the pool. It must not be used afterwards."""
+        self._free.append(game)
+
+    def __len__(self) -> int:
+        return len(self._bots)
+
+    def __repr__(self) -> str:
+        return f"GamePool({len(self._bots)} games)"
+
+
+def play_bot_game(
+    seed: int | None = None,
+    cache: TranspositionCache | None = None,
+    opening_book: OpeningBook | None = None,
+    salvo: bool = False,
+    pool: GamePool | None = None,
+    metrics: GameMetrics | None = None,
+) -> tuple[BattleshipGame, int]:
+    """Plays a whole game between two ComputerPlayers. Returns the finished game and the number of shots fired.
+    Games with the same seed are identical. If a pool is given, the game comes from it (and its settings replace
+    cache, opening_book, salvo and metrics) and should be released back to it once the caller is done
+    with it."""
+    if seed is not None:
+        random.seed(seed)
+    if pool is not None:
+        game, bot_one, bot_two = pool.acquire()
+        salvo = pool.salvo
+    else:
+        game, bot_one, bot_two = new_bot_game(cache, opening_book, salvo, metrics)
+    shots = 0
+    while game.winner() is None:
+        bot = bot_one if game.turn == Player.ONE else bot_two
+        if salvo:
+            coordinates = bot.salvo_coordinates(game.shots_allowed(game.turn))
+            game.attempt_strikes(coordinates)
+            bot.update_salvo_weights()
+            shots += len(coordinates)
+        else:
+            game.attempt_strike(bot.strike_coordinates())
+            bot.update_weights()
+            shots += 1
+    return (game, shots)
+
+
+def build_opening_book(
+    path: str, games: int = 10000, max_shots: int = 4, min_count: int = 2, seed: int = 0
+) -> int:
+    """Plays the given number of games and stores every hunt-mode distribution needed in a bot's first max_shots
+    shots that came up at least min_count times in an opening book at path.
+    Returns the number of entries written."""
+    entries = {}
+    counts = {}
+    prior_key = None
+    for game_num in range(games):
+        random.seed(seed + game_num)
+        game, bot_one, bot_two = new_bot_game()
+        prior_key = bot_one._prior_key
+        while game.winner() is None and (
+            bot_one._shots_fired < max_shots or bot_two._shots_fired < max_shots
+        ):
+            bot = bot_one if game.turn == Player.ONE else bot_two
+            if bot._shots_fired < max_shots and len(bot._targets) == 0:
+                # the distribution is taken before strike_coordinates marks its pick as struck, and
+                # update_weights keeps smallest_ship_size current after every sink
+                key = (bot._opponent_board_hash(), bot.smallest_ship_size)
+                if key not in entries:
+                    entries[key] = bot._compute_hunt_distribution()
+                counts[key] = counts.get(key, 0) + 1
+            coordinates = bot.strike_coordinates()
+            game.attempt_strike(coordinates)
+            bot.update_weights()
+
+    entries = {key: entries[key] for key in entries if counts[key] >= min_count}
+    write_opening_book(path, entries, 10, FLEET_SIZES, prior_key, max_shots)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Headless SeaStrike bot vs bot games")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    play_parser = subparsers.add_parser("play", help="play bot vs bot games")
+    play_parser.add_argument("--games", type=int, default=1000)
+    play_parser.add_argument("--seed", type=int, default=0)
+    play_parser.add_argument("--opening-book")
+    play_parser.add_argument("--salvo", action="store_true")
+    play_parser.add_argument(
+        "--cache", action="store_true", help="reuse hunt distributions across games"
+    )
+    play_parser.add_argument(
+        "--metrics-file", help="export Prometheus metrics to this file while playing"
+    )
+    play_parser.add_argument("--metrics-interval", type=float, default=15.0)
+    play_parser.add_argument(
+        "--record", help="append every game to this compressed record file"
+    )
+    book_parser = subparsers.add_parser("build-book", help="build an opening book")
+    book_parser.add_argument("path")
+    book_parser.add_argument("--games", type=int, default=10000)
+    book_parser.add_argument("--max-shots", type=int, default=4)
+    book_parser.add_argument("--min-count", type=int, default=2)
+    book_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "play":
+        cache = TranspositionCache() if args.cache else None
+        book = OpeningBook(args.opening_book) if args.opening_book else None
+        metrics = exporter = None
+        if args.metrics_file:
+            metrics = GameMetrics()
+            exporter = MetricsExporter(
+                metrics, args.metrics_file, args.metrics_interval
+            )
+            exporter.start()
+        pool = GamePool(cache, book, args.salvo, metrics)
+        writer = GameRecordWriter(args.record) if args.record else None
+        wins = {Player.ONE: 0, Player.TWO: 0}
+        total_shots = 0
+        for game_num in range(args.games):
+            game, shots = play_bot_game(args.seed + game_num, pool=pool)
+            wins[game.winner()] += 1
+            total_shots += shots
+            if writer is not None:
+                writer.submit(game)
+            pool.release(game)
+        if writer is not None:
+            writer.close()
+            stats = writer.stats()
+            print(
+                f"Recorded {stats['written']} games in {stats['blocks']} blocks, "
+                f"{stats['compressed_bytes']} bytes ({stats['raw_bytes']} uncompressed)"
+            )
+        if exporter is not None:
+            exporter.stop()
+        summary = (
+            f"{args.games} games: player one won {wins[Player.ONE]}, player two won {wins[Player.TWO]}, "
+            f"{total_shots / args.games:.1f} shots per game"
+        )
+        if cache is not None:
+            summary += f", cache hit rate {cache.hit_rate():.1%}"
+        print(summary)
+    else:
+        count = build_opening_book(
+            args.path, args.games, args.max_shots, args.min_count, args.seed
+        )
+        print(f"Wrote {count} positions to {args.path}")